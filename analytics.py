@@ -0,0 +1,263 @@
+"""Dashboard totals behind ``GET /analytics``, cached per time bucket.
+
+One grouped query over vouchers, voucher_summary (the bale counts, see
+summary.py) and payments per cache miss. Everything is bucketed by the
+voucher's bill date, so a voucher's bales and payment count in the period the
+voucher belongs to. Results are kept per (granularity, group_by, bucket):
+a dashboard asking for the last 12 months again reads nothing from the
+database, and after a write only the buckets holding the bill dates of
+the touched vouchers are recomputed.
+
+Invalidation: ``summary.refresh_voucher_summaries`` (called by every write
+path that changes bales or voucher totals) and Payment creation mark their
+vouchers with ``touch``; the bill dates are looked up before the commit and
+their buckets dropped after it. Like ``cache.master_cache`` the cache is per
+process; ANALYTICS_CACHE_TTL bounds how long other worker processes keep
+serving a bucket changed elsewhere.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import Date, and_, cast, event, func, select
+from sqlalchemy.orm import Session
+import models
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+MAX_CACHED_BUCKETS = 20000  # per process, across all granularities and groupings
+MAX_BUCKETS = 1000  # per request
+CHUNK_SIZE = 500  # voucher numbers per IN (...)
+
+GRANULARITIES = ("day", "week", "month")
+GROUP_BYS = ("none", "transport", "party")
+# Span of a request without date_from
+DEFAULT_SPANS = {"day": timedelta(days=30), "week": timedelta(weeks=12), "month": timedelta(days=365)}
+
+SUM_FIELDS = ("vouchers", "total_amount", "bales", "accepted_bales", "rejected_bales",
+              "payments", "net_payable", "tds_withheld")
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())  # ISO weeks, starting Monday
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(weeks=1)
+    if granularity == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def buckets(date_from: date, date_to: date, granularity: str) -> list:
+    """Starts of the buckets covering ``date_from`` .. ``date_to`` (inclusive)."""
+    starts = []
+    start = bucket_start(date_from, granularity)
+    while start <= date_to:
+        starts.append(start)
+        start = next_bucket(start, granularity)
+    return starts
+
+
+def _bucket_expression(column, granularity: str, dialect: str):
+    # Must agree with bucket_start above
+    if granularity == "day":
+        return column
+    if dialect == "sqlite":
+        modifiers = ("weekday 0", "-6 days") if granularity == "week" else ("start of month",)
+        return func.date(column, *modifiers, type_=Date)
+    return cast(func.date_trunc(granularity, column), Date)
+
+
+def _group_columns(group_by: str) -> list:
+    voucher = models.Voucher
+    return {"none": [], "transport": [voucher.transport_id], "party": [voucher.party_name]}[group_by]
+
+
+def _query(db: Session, granularity: str, group_by: str, first: date, last: date):
+    """Totals per bucket (and group) for bill dates ``first`` .. ``last`` (inclusive)."""
+    voucher, summary, payment = models.Voucher, models.VoucherSummary, models.Payment
+    # Aggregated per bill first, so a bill with several payments does not repeat its voucher
+    payments = select(
+        payment.bill_no,
+        func.count(payment.id).label("payments"),
+        func.sum(payment.net_payable).label("net_payable"),
+        func.sum(payment.net_total * payment.tds_percent / 100).label("tds_withheld"),
+    ).group_by(payment.bill_no).subquery()
+
+    period = _bucket_expression(voucher.bill_date, granularity, db.get_bind().dialect.name).label("period")
+    groups = _group_columns(group_by)
+    query = select(
+        period,
+        *groups,
+        func.count(voucher.id).label("vouchers"),
+        func.coalesce(func.sum(voucher.total_amount), 0).label("total_amount"),
+        func.coalesce(func.sum(summary.total_bales), 0).label("bales"),
+        func.coalesce(func.sum(summary.accepted_bales), 0).label("accepted_bales"),
+        func.coalesce(func.sum(summary.rejected_bales), 0).label("rejected_bales"),
+        func.coalesce(func.sum(payments.c.payments), 0).label("payments"),
+        func.coalesce(func.sum(payments.c.net_payable), 0).label("net_payable"),
+        func.coalesce(func.sum(payments.c.tds_withheld), 0).label("tds_withheld"),
+    ).select_from(voucher).outerjoin(
+        # voucher_id: the one voucher a (legacy, duplicated) voucher number's bales are counted for
+        summary, summary.voucher_id == voucher.id
+    ).outerjoin(
+        # Same voucher for the bill's payments, so they are not counted once per duplicate
+        payments, and_(payments.c.bill_no == voucher.voucher_number, summary.voucher_id.is_not(None))
+    ).where(
+        voucher.bill_date >= first, voucher.bill_date <= last
+    ).group_by(period, *groups)
+    return db.execute(query).all()
+
+
+class RollupCache:
+    """Per-process cache of analytics buckets, dropped bucket by bucket on writes."""
+
+    def __init__(self, ttl: float = ANALYTICS_CACHE_TTL, max_buckets: int = MAX_CACHED_BUCKETS):
+        self.ttl = ttl
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # (granularity, group_by, start) -> (rows, expires_at)
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, db: Session, granularity: str, group_by: str, date_from: date, date_to: date):
+        """``[(bucket_start, rows)]`` for the buckets covering the range; ``rows`` are dicts per group."""
+        starts = buckets(date_from, date_to, granularity)
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            generation = self._generation
+            for start in starts:
+                entry = self._buckets.get((granularity, group_by, start))
+                if entry is not None and entry[1] > now:
+                    found[start] = entry[0]
+        missing = [start for start in starts if start not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            computed = {start: [] for start in missing}
+            last = next_bucket(missing[-1], granularity) - timedelta(days=1)
+            for row in _query(db, granularity, group_by, missing[0], last):
+                # Cached buckets between the missing ones are recomputed, not stored again
+                if row.period in computed:
+                    computed[row.period].append(row._asdict())
+            found.update(computed)
+            self._store(granularity, group_by, computed, generation)
+        return [(start, found[start]) for start in starts]
+
+    def _store(self, granularity: str, group_by: str, computed: dict, generation: int):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            # A write committed while we were reading may be missing from these rows
+            if generation != self._generation:
+                return
+            for start, rows in computed.items():
+                key = (granularity, group_by, start)
+                self._buckets[key] = (rows, expires_at)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+    def invalidate(self, days: Iterable[date]):
+        days = set(days)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._buckets if any(bucket_start(day, key[0]) == key[2] for day in days)]:
+                del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._buckets.clear()
+
+
+rollups = RollupCache()
+
+
+def touch(db: Session, voucher_numbers: Iterable[str]):
+    """Mark vouchers whose totals, bales or payment change in this transaction."""
+    db.info.setdefault("analytics_vouchers", set()).update(voucher_numbers)
+
+
+@event.listens_for(Session, "before_commit")
+def _collect_days(session):
+    voucher_numbers = list(session.info.pop("analytics_vouchers", ()))
+    if not voucher_numbers:
+        return
+    session.flush()
+    days = session.info.setdefault("analytics_days", set())
+    for start in range(0, len(voucher_numbers), CHUNK_SIZE):
+        days.update(session.execute(
+            select(models.Voucher.bill_date).where(
+                models.Voucher.voucher_number.in_(voucher_numbers[start:start + CHUNK_SIZE]),
+                models.Voucher.bill_date.is_not(None)
+            ).distinct()
+        ).scalars())
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(session):
+    days = session.info.pop("analytics_days", None)
+    if days:
+        rollups.invalidate(days)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("analytics_vouchers", None)
+    session.info.pop("analytics_days", None)
+
+
+def _summarize(totals: dict) -> dict:
+    totals["total_amount"] = round(totals["total_amount"], 2)
+    totals["net_payable"] = round(totals["net_payable"], 2)
+    totals["tds_withheld"] = round(totals["tds_withheld"], 2)
+    totals["rejection_rate"] = round(totals["rejected_bales"] / totals["bales"], 4) if totals["bales"] else None
+    return totals
+
+
+def report(db: Session, granularity: str = "month", group_by: str = "none",
+           date_from: Optional[date] = None, date_to: Optional[date] = None, transports: Optional[dict] = None):
+    """Rows per bucket (and transport / party), plus totals over the whole range.
+
+    The range is widened to whole buckets. Raises ValueError for an empty or
+    too long range.
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - DEFAULT_SPANS[granularity]
+    if date_from > date_to:
+        raise ValueError("date_from is after date_to")
+    if len(buckets(date_from, date_to, granularity)) > MAX_BUCKETS:
+        raise ValueError(f"More than {MAX_BUCKETS} {granularity} buckets requested; narrow the range")
+
+    rows = []
+    overall = dict.fromkeys(SUM_FIELDS, 0)
+    for start, bucket_rows in rollups.get(db, granularity, group_by, date_from, date_to):
+        for row in sorted(bucket_rows, key=lambda r: -r["total_amount"]):
+            row = dict(row, period=start)
+            if group_by == "transport":
+                transport = (transports or {}).get(row["transport_id"])
+                row["transport_name"] = transport["transport_name"] if transport else None
+            for field in SUM_FIELDS:
+                overall[field] += row[field]
+            rows.append(_summarize(row))
+
+    first = bucket_start(date_from, granularity)
+    last = next_bucket(bucket_start(date_to, granularity), granularity) - timedelta(days=1)
+    return {
+        "granularity": granularity,
+        "group_by": group_by,
+        "date_from": first,
+        "date_to": last,
+        "count": len(rows),
+        "totals": _summarize(overall),
+        "rows": rows,
+    }
@@ -0,0 +1,145 @@
+"""Mixed read/write load against the sync and async database stacks.
+
+Runs the app in-process through httpx's ASGI transport once with DB_ASYNC=0 and
+once with DB_ASYNC=1, firing slow /voucher-details reads, fast lookups and
+/accept-bales writes concurrently, and prints p50/p99 latency per request kind.
+
+    python benchmarks/async_vs_sync.py --vouchers 2000 --bales 20
+
+Needs httpx (and aiosqlite for the async run) on top of requirements.txt.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(vouchers: int, bales: int):
+    import models
+    from database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.TransportCompany.__table__.insert(), [
+            {"id": 1, "transport_name": "Bench Transport", "address": "-", "contact": "-", "rate": 1.0}
+        ])
+        conn.execute(models.Item.__table__.insert(), [
+            {"id": 1, "item_number": "I-1", "item_name": "Bench Item", "quantity": 1}
+        ])
+        conn.execute(models.QuantityUnit.__table__.insert(), [{"id": 1, "quantity_unit": "PCS"}])
+        conn.execute(models.Voucher.__table__.insert(), [
+            {
+                "id": v, "voucher_number": f"V{v}", "bill_date": date(2025, 1, 1 + v % 28),
+                "invoice_number": f"INV{v}", "party_name": f"Party {v % 50}", "transport_id": 1,
+                "lr_number": f"LR{v}", "item_id": 1, "quantity": bales, "unit_id": 1, "rate": 10.0,
+                "total_amount": 10.0 * bales, "round_off": 0.0,
+            }
+            for v in range(1, vouchers + 1)
+        ])
+        conn.execute(models.VoucherBale.__table__.insert(), [
+            {
+                "voucher_id": v, "voucher_number": f"V{v}", "invoice_number": f"INV{v}",
+                "bale_number": f"B{v}-{b}", "status": "Rejected", "remarks": "Normal", "quantity": 1.0,
+            }
+            for v in range(1, vouchers + 1) for b in range(bales)
+        ])
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000
+
+
+async def drive(args):
+    import httpx
+    import database
+    from main import app
+
+    latencies = {"slow_read": [], "fast_read": [], "write": []}
+
+    errors = 0
+
+    async def call(kind, method, url, **kwargs):
+        nonlocal errors
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            errors += 1
+        latencies[kind].append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        tasks = []
+        for _ in range(args.slow):
+            tasks.append(call("slow_read", "GET", "/voucher-details", params={"limit": 500}))
+        for _ in range(args.fast):
+            v = random.randint(1, args.vouchers)
+            tasks.append(call("fast_read", "GET", "/voucher-bales", params={"voucher_number": f"V{v}"}))
+            tasks.append(call("fast_read", "GET", "/transports"))
+        for _ in range(args.writes):
+            v = random.randint(1, args.vouchers)
+            tasks.append(call("write", "PATCH", "/accept-bales", json={
+                "voucher_number": f"V{v}", "bale_numbers": [f"B{v}-{random.randrange(args.bales)}"]
+            }))
+        random.shuffle(tasks)
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+    return {
+        "mode": "async" if os.environ.get("DB_ASYNC") == "1" else "sync",
+        "elapsed_s": round(elapsed, 3),
+        "errors": errors,
+        **{
+            kind: {"n": len(v), "p50_ms": round(percentile(v, 50), 1), "p99_ms": round(percentile(v, 99), 1)}
+            for kind, v in latencies.items() if v
+        },
+    }
+
+
+def run_one(args):
+    os.chdir(tempfile.mkdtemp(prefix="lrentry-bench-"))
+    sys.path.insert(0, ROOT)
+    seed(args.vouchers, args.bales)
+    print(json.dumps(asyncio.run(drive(args))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vouchers", type=int, default=2000)
+    parser.add_argument("--bales", type=int, default=20)
+    parser.add_argument("--slow", type=int, default=20, help="concurrent /voucher-details calls")
+    parser.add_argument("--fast", type=int, default=200, help="concurrent lookup pairs")
+    parser.add_argument("--writes", type=int, default=50, help="concurrent /accept-bales calls")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_one(args)
+        return
+
+    # Each mode needs a fresh interpreter: the stack is chosen when database.py is imported
+    for mode in ("0", "1"):
+        # Every request is fired at once, so let them queue for a connection instead of timing out
+        env = dict(os.environ, DB_ASYNC=mode)
+        env.setdefault("DB_POOL_TIMEOUT", "600")
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", *sys.argv[1:]],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        print(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Fill an empty database with synthetic, reproducible LR Entry data.
+
+    python benchmarks/generate_data.py --url sqlite:///./bench.db --vouchers 100000 --bales-per-voucher 100
+    python benchmarks/generate_data.py --url sqlite:///./small.db --vouchers 2000 --bales-per-voucher 20
+
+The same --seed always produces the same rows. The shape follows the real data:
+- a few transporters and parties carry most of the traffic (Zipf weights);
+- LR numbers run per transporter with gaps, and some LRs cover several vouchers;
+- bale numbers restart every financial year, so they repeat across vouchers;
+- older vouchers are mostly fully accepted with a Payment, newer ones partly
+  scanned.
+
+Creates the schema and indexes and fills voucher_summary and the search index. The target must
+not hold vouchers yet.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models  # noqa: E402
+import search  # noqa: E402
+import summary  # noqa: E402
+from database import create_missing_indexes  # noqa: E402
+
+BATCH_SIZE = 20000  # bale rows per INSERT transaction
+
+TRANSPORTERS = ("Koyal", "Shree Ganesh", "Bharat", "Jai Mata Di", "Sai Baba", "Om", "Navkar", "Ambika",
+                "Balaji", "Shiv Shakti", "Krishna", "Mahalaxmi", "Patel", "Rajdhani", "Gujarat", "Punjab")
+TRANSPORT_SUFFIXES = ("Transport", "Roadways", "Logistics", "Carriers", "Freight Movers")
+CITIES = ("Dimna", "Jamshedpur", "Surat", "Ahmedabad", "Ludhiana", "Delhi", "Kolkata", "Bhiwandi", "Erode", "Tiruppur")
+FABRICS = ("Peticoat", "Cotton Shirting", "Poplin", "Rayon", "Denim", "Suiting", "Saree", "Dhoti", "Lining", "Voile")
+PARTY_WORDS = ("Traders", "Textiles", "Fabrics", "Enterprises", "Garments", "Sons", "& Co.", "Agencies")
+UNITS = ("Kg", "Pcs", "Mtr", "Bale", "Ton")
+REMARKS = (("Normal", 0.85), ("Excess Quantity", 0.08), ("Less Quantity", 0.07))
+
+
+def zipf_weights(n: int, s: float = 1.1):
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def financial_year(day: date) -> str:
+    start = day.year if day.month >= 4 else day.year - 1
+    return f"{start % 100:02d}-{(start + 1) % 100:02d}"
+
+
+def _fast_sqlite_load(engine):
+    # Bulk load only: a crash mid-way leaves a file to delete, not data to keep
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=MEMORY")
+        dbapi_connection.execute("PRAGMA synchronous=OFF")
+
+
+def generate(url: str, vouchers: int, bales_per_voucher: float, transports: int, parties: int,
+             days: int, end: date, accepted: float, seed: int, log=print):
+    rng = random.Random(seed)
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        _fast_sqlite_load(engine)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(models.Voucher)).scalar():
+            raise SystemExit("Target already holds vouchers; generate into an empty database.")
+
+    started = time.perf_counter()
+    transport_names = {
+        i: f"{TRANSPORTERS[i % len(TRANSPORTERS)]} {TRANSPORT_SUFFIXES[i % len(TRANSPORT_SUFFIXES)]}"
+           + (f" {i // len(TRANSPORTERS)}" if i >= len(TRANSPORTERS) else "")
+        for i in range(1, transports + 1)
+    }
+    with engine.begin() as conn:
+        conn.execute(models.TransportCompany.__table__.insert(), [
+            {"id": i, "transport_name": name, "address": rng.choice(CITIES),
+             "contact": f"9{rng.randrange(10 ** 8, 10 ** 9)}", "rate": round(rng.uniform(20, 80), 1)}
+            for i, name in transport_names.items()
+        ])
+        conn.execute(models.Item.__table__.insert(), [
+            {"id": i, "item_number": str(100 + i), "item_name": f"{FABRICS[i % len(FABRICS)]} {i}",
+             "quantity": rng.randrange(50, 200)}
+            for i in range(1, 201)
+        ])
+        conn.execute(models.QuantityUnit.__table__.insert(), [
+            {"id": i, "quantity_unit": unit} for i, unit in enumerate(UNITS, start=1)
+        ])
+
+    transport_ids = list(range(1, transports + 1))
+    transport_weights = zipf_weights(transports)
+    transport_rates = {i: round(rng.uniform(4, 12), 1) for i in transport_ids}
+    # e.g. KT7-4821: initials of the transporter, its id, then its running LR number
+    lr_prefix = {i: "".join(word[0] for word in name.split() if word[0].isalpha()).upper() + str(i)
+                 for i, name in transport_names.items()}
+    lr_next = {i: rng.randrange(1000, 5000) for i in transport_ids}
+    party_names = [f"{rng.choice(CITIES)} {rng.choice(FABRICS).split()[0]} {rng.choice(PARTY_WORDS)} {i}"
+                   for i in range(1, parties + 1)]
+    party_weights = zipf_weights(parties)
+    remark_values, remark_weights = zip(*REMARKS)
+    remark_weights = list(itertools.accumulate(remark_weights))
+    # lognormal bale counts with the requested mean
+    sigma = 0.6
+    mu = math.log(max(bales_per_voucher, 1)) - sigma ** 2 / 2
+
+    start_day = end - timedelta(days=days)
+    voucher_rows, bale_rows, payment_rows = [], [], []
+    bale_serial = {}
+    voucher_seq = {}
+    last_lr = {}
+    bale_id = payment_id = 0
+    total_bales = total_payments = 0
+
+    def flush():
+        nonlocal total_bales, total_payments
+        with engine.begin() as conn:
+            if voucher_rows:
+                conn.execute(models.Voucher.__table__.insert(), voucher_rows)
+            if bale_rows:
+                conn.execute(models.VoucherBale.__table__.insert(), bale_rows)
+            if payment_rows:
+                conn.execute(models.Payment.__table__.insert(), payment_rows)
+        total_bales += len(bale_rows)
+        total_payments += len(payment_rows)
+        voucher_rows.clear()
+        bale_rows.clear()
+        payment_rows.clear()
+
+    for voucher_id in range(1, vouchers + 1):
+        # Vouchers arrive in bill-date order, fewer on Sundays
+        day = start_day + timedelta(days=int(days * (voucher_id - 1) / vouchers))
+        if day.weekday() == 6 and rng.random() < 0.7:
+            day -= timedelta(days=1)
+        fy = financial_year(day)
+        seq = voucher_seq[fy] = voucher_seq.get(fy, 0) + 1
+        transport_id = rng.choices(transport_ids, cum_weights=transport_weights)[0]
+        # One LR regularly covers several vouchers of the same consignment
+        if transport_id in last_lr and rng.random() < 0.1:
+            lr_number = last_lr[transport_id]
+        else:
+            lr_next[transport_id] += rng.choice((1, 1, 1, 2, 3))
+            lr_number = f"{lr_prefix[transport_id]}-{lr_next[transport_id]}"
+            last_lr[transport_id] = lr_number
+        voucher_number = f"SV/{fy}/{seq:06d}"
+
+        age = (end - day).days
+        fully_accepted = rng.random() < (accepted if age > 30 else accepted * age / 30)
+        accept_share = 1.0 if fully_accepted else rng.random() * 0.9
+
+        bale_count = max(1, int(rng.lognormvariate(mu, sigma)))
+        quantity = 0.0
+        for _ in range(bale_count):
+            bale_id += 1
+            serial = bale_serial[fy] = bale_serial.get(fy, 0) + 1
+            remarks = rng.choices(remark_values, cum_weights=remark_weights)[0]
+            bale_quantity = round(max(5.0, rng.gauss(50, 8)) * 2) / 2
+            quantity += bale_quantity
+            bale_rows.append({
+                "id": bale_id, "voucher_id": voucher_id, "voucher_number": voucher_number,
+                "invoice_number": f"INV/{fy}/{seq:06d}", "bale_number": f"B{serial:07d}",
+                "remarks": remarks, "quantity": bale_quantity,
+                "status": "Accepted" if fully_accepted or rng.random() < accept_share else "Rejected",
+            })
+
+        rate = transport_rates[transport_id]
+        total_amount = round(quantity * rate, 2)
+        voucher_rows.append({
+            "id": voucher_id, "voucher_number": voucher_number, "bill_date": day,
+            "invoice_number": f"INV/{fy}/{seq:06d}",
+            "party_name": rng.choices(party_names, cum_weights=party_weights)[0],
+            "transport_id": transport_id, "lr_number": lr_number,
+            "item_id": rng.randrange(1, 201), "quantity": quantity, "unit_id": rng.randrange(1, len(UNITS) + 1),
+            "actual_weight": round(quantity * rng.uniform(0.95, 1.05), 1), "charged_weight": quantity,
+            "rate": rate, "amount": total_amount, "base_amount": total_amount, "extra_charges": 0.0,
+            "total_amount": total_amount, "round_off": round(total_amount) - total_amount,
+        })
+
+        if fully_accepted:
+            payment_id += 1
+            payment_rows.append({
+                "id": payment_id, "bill_no": voucher_number, "lr_no": lr_number, "amount": total_amount,
+                "tds_percent": 2.0, "net_total": total_amount, "net_payable": total_amount * 0.98,
+                "payment_status": "Complete" if age > 45 and rng.random() < 0.8 else "Incomplete",
+                "created_at": datetime.combine(day, datetime.min.time()) + timedelta(
+                    days=rng.randrange(1, 15), seconds=rng.randrange(86400)),
+                "quantity": int(quantity),
+            })
+
+        if len(bale_rows) >= BATCH_SIZE:
+            flush()
+            log(f"  {voucher_id}/{vouchers} vouchers, {total_bales} bales ({time.perf_counter() - started:.0f}s)")
+    flush()
+
+    log("Creating indexes, voucher_summary and the search index ...")
+    create_missing_indexes(models.Base.metadata, engine)
+    with Session(engine) as db:
+        summary.rebuild(db)
+    search.ensure_search_index(engine)
+    engine.dispose()
+    log(f"{vouchers} vouchers, {total_bales} bales, {total_payments} payments, {transports} transports "
+        f"in {time.perf_counter() - started:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///./bench.db")
+    parser.add_argument("--vouchers", type=int, default=100000)
+    parser.add_argument("--bales-per-voucher", type=float, default=100, help="mean; counts are lognormal")
+    parser.add_argument("--transports", type=int, default=40)
+    parser.add_argument("--parties", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=730, help="span of bill dates")
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2025, 6, 30), help="last bill date")
+    parser.add_argument("--accepted", type=float, default=0.9,
+                        help="share of vouchers older than 30 days that are fully accepted")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.url, args.vouchers, args.bales_per_voucher, args.transports, args.parties,
+             args.days, args.end, args.accepted, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""Drive every API route and record throughput and latency percentiles as JSON.
+
+    python benchmarks/generate_data.py --url sqlite:///./bench.db --vouchers 20000 --bales-per-voucher 50
+    python benchmarks/load_test.py --db bench.db --mode asgi --out results/$(git rev-parse --short HEAD).json
+    python benchmarks/load_test.py --db bench.db --mode uvicorn --concurrency 16
+    python benchmarks/load_test.py --compare results/old.json results/new.json --threshold 0.15
+
+Each run works on a throw-away copy of --db, so write routes never change the
+source and repeated runs start from the same data. --mode asgi calls the app
+in-process through httpx's ASGI transport, which measures the handlers
+without network or server overhead. --mode uvicorn starts a real uvicorn
+server on a free port.
+
+Routes run one after another, reads first and writes last. Each gets
+--requests calls (scaled by its weight) from --concurrency closed-loop
+clients. --compare exits with status 1 when any route's p95 got slower by
+more than --threshold.
+
+Needs httpx (and uvicorn for --mode uvicorn) on top of requirements.txt.
+DB_ASYNC and the other database settings are passed through from the
+environment.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- Request factories -------------------------------------------------------
+
+class Samples:
+    """Keys drawn from the database copy, so requests hit real rows."""
+
+    def __init__(self, path: str, rng: random.Random, size: int = 2000):
+        conn = sqlite3.connect(path)
+        self.rng = rng
+        self.counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("vouchers", "voucher_bales", "payments", "transport_companies")
+        }
+        # Incomplete payments for /payments/mark-complete; their vouchers are kept out of
+        # the scan/correction pool, which a complete payment would lock
+        self.incomplete_payments = conn.execute(
+            "SELECT bill_no, lr_no FROM payments WHERE payment_status != 'Complete' ORDER BY RANDOM() LIMIT ?",
+            (size // 2,)
+        ).fetchall()
+        reserved = {bill_no for bill_no, _ in self.incomplete_payments}
+        # Vouchers without a complete payment can still be scanned and corrected
+        self.open_vouchers = [row[0] for row in conn.execute(
+            "SELECT voucher_number FROM vouchers WHERE voucher_number NOT IN "
+            "(SELECT bill_no FROM payments WHERE payment_status = 'Complete') ORDER BY RANDOM() LIMIT ?",
+            (size + len(reserved),)
+        ) if row[0] not in reserved][:size]
+        self.bales = {}
+        for voucher_number, bale_number in conn.execute(
+            f"SELECT voucher_number, bale_number FROM voucher_bales WHERE voucher_number IN "
+            f"({','.join('?' * len(self.open_vouchers))})", self.open_vouchers
+        ):
+            self.bales.setdefault(voucher_number, []).append(bale_number)
+        self.open_vouchers = [v for v in self.open_vouchers if v in self.bales]
+        self.lr_numbers = [row[0] for row in conn.execute(
+            "SELECT lr_number FROM vouchers ORDER BY RANDOM() LIMIT ?", (size,))]
+        self.max_voucher_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vouchers").fetchone()[0]
+        self.transport_ids = [row[0] for row in conn.execute("SELECT id FROM transport_companies")] or [1]
+        last_bill_date = conn.execute("SELECT MAX(bill_date) FROM vouchers").fetchone()[0]
+        self.last_bill_date = date.fromisoformat(last_bill_date) if last_bill_date else date.today()
+        conn.close()
+        self.serial = 0
+
+    def unique(self, prefix: str) -> str:
+        self.serial += 1
+        return f"{prefix}-{os.getpid()}-{self.serial}"
+
+    def open_voucher(self):
+        voucher_number = self.rng.choice(self.open_vouchers)
+        return voucher_number, self.bales[voucher_number]
+
+    def new_voucher(self):
+        number = self.unique("LT")
+        return {
+            "voucher_number": number, "bill_date": date.today().isoformat(), "invoice_number": f"INV-{number}",
+            "party_name": "Load Test Traders", "transport_id": self.rng.choice(self.transport_ids),
+            "lr_number": f"LR-{number}", "item_id": 1, "quantity": 100, "unit_id": 1, "actual_weight": 100,
+            "charged_weight": 100, "rate": 6.0, "amount": 600, "base_amount": 600, "extra_charges": 0,
+            "total_amount": 600, "round_off": 0,
+            "bales": [{"bale_number": f"{number}-B{i}", "quantity": 50} for i in range(20)],
+        }
+
+    def status_rows(self, count: int):
+        return [
+            {"bill_no": f"SV/{i}", "lr_no": f"LR{i}", "transport_name": "Load Test Transport",
+             "payment_status": "Paid" if i % 3 else "Incomplete", "net_payable": 1000.0 + i,
+             "created_at": (datetime(2025, 1, 1) + timedelta(minutes=i)).isoformat()}
+            for i in range(count)
+        ]
+
+
+def scenarios(s: Samples, job_ids: list):
+    """(method, route, weight, ok statuses, request factory) in run order.
+
+    A route runs ``--requests * weight`` times, and at least once (weight 0 is
+    a single call, for full exports).
+    """
+    rng = s.rng
+    month_ago = (date.today() - timedelta(days=30)).isoformat()
+    ok = {200}
+
+    def accept():
+        voucher_number, bales = s.open_voucher()
+        return {"json": {"voucher_number": voucher_number, "bale_numbers": rng.sample(bales, min(3, len(bales)))}}
+
+    def correction():
+        voucher_number, bales = s.open_voucher()
+        return {"voucher_number": voucher_number, "bale_number": rng.choice(bales),
+                "quantity": round(rng.uniform(40, 60), 1), "remarks": rng.choice(("Normal", "Excess Quantity"))}
+
+    def mark_complete():
+        bill_no, lr_no = s.incomplete_payments.pop() if s.incomplete_payments else ("none", "none")
+        return {"json": {"lr_numbers": [lr_no], "bill_numbers": [bill_no]}}
+
+    def job_id():
+        return {"path": {"job_id": rng.choice(job_ids) if job_ids else "missing"}}
+
+    def export_job():
+        return {"kind": "export", "params": {
+            "dataset": "payment_status", "transport_id": rng.choice(s.transport_ids), "created_from": month_ago}}
+
+    async def job_to_result(client):
+        # End to end: submit, poll until the job finishes, download the result
+        response = await client.post("/jobs", json=export_job())
+        if response.status_code != 202:
+            return response
+        job_id = response.json()["job"]["id"]
+        while True:
+            response = await client.get(f"/jobs/{job_id}")
+            if response.status_code != 200 or response.json()["status"] not in ("queued", "running"):
+                break
+            await asyncio.sleep(0.05)
+        return await client.get(f"/jobs/{job_id}/result")
+
+    return [
+        # Reads
+        ("GET", "/transports", 1, ok, lambda: {}),
+        ("GET", "/items", 1, ok, lambda: {}),
+        ("GET", "/units", 1, ok, lambda: {}),
+        ("GET", "/voucher-bales", 1, ok, lambda: {"params": {"voucher_number": s.open_voucher()[0]}}),
+        ("GET", "/voucher-summary", 1, ok, lambda: {"params": {"fully_accepted": "true", "limit": 100}}),
+        ("GET", "/voucher-details", 0.5, ok, lambda: {"params": {
+            "limit": 100, "cursor": rng.randrange(max(1, s.max_voucher_id - 100))}}),
+        ("GET", "/payments/recent", 0.5, ok, lambda: {}),
+        ("GET", "/payments/totals", 0.5, ok, lambda: {}),
+        ("POST", "/payments/by-lr", 1, ok, lambda: {"json": {
+            "lr_numbers": rng.sample(s.lr_numbers, min(20, len(s.lr_numbers))), "bill_numbers": []}}),
+        ("GET", "/payment-status", 0.5, {200, 404}, lambda: {"params": {"limit": 100}}),
+        ("GET", "/analytics", 1, ok, lambda: {"params": {
+            "granularity": rng.choice(("day", "week", "month")), "group_by": rng.choice(("none", "transport", "party")),
+            "date_to": s.last_bill_date}}),
+        ("GET", "/search", 1, ok, lambda: {"params": {"q": rng.choice(s.lr_numbers)[-5:]}}),
+        ("GET", "/changes", 1, ok, lambda: {"params": {"since": 0, "limit": 100}}),
+        ("GET", "/metrics", 0.2, ok, lambda: {}),
+        # Rendering and exports
+        ("POST", "/generate-payment-pdf", 0.1, ok, lambda: {"json": {"statuses": s.status_rows(60)}}),
+        ("GET", "/payment-report", 0.05, ok, lambda: {"params": {
+            "transport_id": rng.choice(s.transport_ids), "created_from": month_ago}}),
+        ("GET", "/all-voucher-bales-full", 0, ok, lambda: {"params": {"format": "ndjson"}}),
+        # Writes
+        ("POST", "/add-transport", 0.2, ok, lambda: {"json": {
+            "transport_name": s.unique("Load Test Transport"), "address": "-", "contact": "-", "rate": 1.0}}),
+        ("POST", "/add-item", 0.2, ok, lambda: {"json": {
+            "item_number": s.unique("LT"), "item_name": "Load Test Item", "quantity": 1}}),
+        ("POST", "/add-unit", 0.2, ok, lambda: {"json": {"quantity_unit": s.unique("LTU")}}),
+        ("POST", "/add-voucher", 0.5, ok, lambda: {"json": s.new_voucher()}),
+        ("POST", "/vouchers/bulk", 0.1, ok, lambda: {"json": [s.new_voucher() for _ in range(20)]}),
+        ("PATCH", "/accept-bales", 1, ok, accept),
+        ("PATCH", "/accept-bales/batch", 0.5, ok, lambda: {"json": {"vouchers": [accept()["json"] for _ in range(5)]}}),
+        ("POST", "/scans", 2, {202}, lambda: {"json": {"events": [
+            {**accept()["json"], "idempotency_key": s.unique("scan")} for _ in range(3)]}}),
+        ("GET", "/scans/status", 0.2, ok, lambda: {}),
+        ("PATCH", "/update-bale-quantity", 1, ok, lambda: {"json": correction()}),
+        ("PATCH", "/update-bale-quantity/batch", 0.5, ok, lambda: {"json": {"bales": [correction() for _ in range(10)]}}),
+        ("PATCH", "/update-payment-quantity", 0.5, ok, lambda: {"json": {
+            "bale_numbers": [bale for _ in range(10) for bale in s.open_voucher()[1][:20]]}}),
+        ("PATCH", "/payments/mark-complete", 0.5, {200, 404}, mark_complete),
+        # Background jobs
+        ("POST", "/jobs", 0.1, {202}, lambda: {"json": export_job()}),
+        ("GET", "/jobs", 0.5, ok, lambda: {}),
+        ("GET", "/jobs/{job_id}", 0.5, ok, job_id),
+        ("JOB", "/jobs -> /jobs/{job_id}/result", 0.1, ok, lambda: {"run": job_to_result}),
+        ("DELETE", "/jobs/{job_id}", 0.1, ok, job_id),
+    ]
+
+
+# --- Running -----------------------------------------------------------------
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000
+
+
+async def run_route(client, method, route, count, concurrency, ok, factory, job_ids):
+    latencies, statuses = [], {}
+    remaining = count
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            kwargs = factory()
+            url = route.format(**kwargs.pop("path", {})) if "run" not in kwargs else None
+            start = time.perf_counter()
+            # "run": a sequence of requests timed as one, e.g. a job from submission to its result
+            response = await (kwargs["run"](client) if url is None else client.request(method, url, **kwargs))
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if route == "/jobs" and response.status_code == 202:
+                job_ids.append(response.json()["job"]["id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+    elapsed = time.perf_counter() - start
+    return {
+        "n": len(latencies),
+        "errors": sum(n for status, n in statuses.items() if status not in ok),
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) * 1000 / len(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+async def drive(client, samples, args, log):
+    job_ids = []
+    results = {}
+    for method, route, weight, ok, factory in scenarios(samples, job_ids):
+        name = f"{method} {route}"
+        if (args.routes and not re.search(args.routes, name)) or (args.skip and re.search(args.skip, name)):
+            continue
+        count = max(1, int(args.requests * weight))
+        results[name] = await run_route(client, method, route, count, args.concurrency, ok, factory, job_ids)
+        r = results[name]
+        log(f"{name:<42}{r['n']:>6}{r['errors']:>7}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+    return results
+
+
+async def run_asgi(samples, args, log):
+    import httpx
+    from main import app
+
+    import jobs
+
+    # httpx does not run the lifespan; do it here so startup work and shutdown happen as in production
+    async with app.router.lifespan_context(app):
+        try:
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                return await drive(client, samples, args, log)
+        finally:
+            # The server does not wait for job workers; run() removes the directory they run in next
+            await asyncio.to_thread(jobs.shutdown, wait=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(samples, args, log):
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT, "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=dict(os.environ, WEB_CONCURRENCY=str(args.workers))
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            for _ in range(300):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise SystemExit("uvicorn exited during startup")
+                    await asyncio.sleep(0.1)
+            return await drive(client, samples, args, log)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_revision():
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run(args, log=print):
+    workdir = tempfile.mkdtemp(prefix="lrentry-load-")
+    db_path = os.path.join(workdir, "load.db")
+    shutil.copyfile(args.db, db_path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("JOBS_DIR", os.path.join(workdir, "job_results"))
+    # Closed-loop clients can all wait on the pool at once; queue instead of timing out
+    os.environ.setdefault("DB_POOL_TIMEOUT", "600")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    samples = Samples(db_path, random.Random(args.seed))
+    log(f"{samples.counts['vouchers']} vouchers, {samples.counts['voucher_bales']} bales, "
+        f"{samples.counts['payments']} payments; mode={args.mode}, concurrency={args.concurrency}")
+    log(f"{'route':<42}{'n':>6}{'errors':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+
+    started = datetime.utcnow()
+    runner = run_asgi if args.mode == "asgi" else run_uvicorn
+    try:
+        routes = asyncio.run(runner(samples, args, log))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            **git_revision(),
+            "started_at": started.isoformat() + "Z",
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else 1,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+            "db_async": os.environ.get("DB_ASYNC", "0") == "1",
+            "data": samples.counts,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "routes": routes,
+    }
+
+
+def compare(old_path: str, new_path: str, threshold: float, noise_ms: float = 1.0, log=print) -> bool:
+    """Print p95 changes per route; False when any route regressed beyond ``threshold``."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    log(f"{old['meta'].get('commit', '?')[:10]} -> {new['meta'].get('commit', '?')[:10]}")
+    log(f"{'route':<42}{'old p95':>10}{'new p95':>10}{'change':>9}")
+    regressed = []
+    for name in sorted(old["routes"].keys() & new["routes"].keys()):
+        before, after = old["routes"][name]["p95_ms"], new["routes"][name]["p95_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold and after - before > noise_ms:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        if new["routes"][name]["errors"] > old["routes"][name]["errors"]:
+            regressed.append(name)
+            flag += "  MORE ERRORS"
+        log(f"{name:<42}{before:>10.2f}{after:>10.2f}{change:>+9.0%}{flag}")
+    for name in sorted(old["routes"].keys() ^ new["routes"].keys()):
+        log(f"{name:<42}  only in {'old' if name in old['routes'] else 'new'} run")
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="bench.db", help="SQLite file from generate_data.py (copied, never modified)")
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--requests", type=int, default=200, help="calls per route, before weighting")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--routes", help="only run routes matching this regex, e.g. 'GET /payment'")
+    parser.add_argument("--skip", help="skip routes matching this regex")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed p95 slowdown for --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(*args.compare, args.threshold) else 1)
+
+    args.db = os.path.abspath(args.db)
+    out = os.path.abspath(args.out) if args.out else None
+    results = run(args)
+    if out:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
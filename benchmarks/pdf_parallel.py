@@ -0,0 +1,56 @@
+"""Speedup of the parallel payment status PDF renderer by worker count.
+
+    python benchmarks/pdf_parallel.py
+    python benchmarks/pdf_parallel.py --rows 60000 --workers 1 2 4 8
+
+Renders the same rows serially and with each worker count, checks that the
+page count and page text match the serial output, and prints wall time and
+speedup. Worker counts above the machine's core count are still run, but
+cannot be expected to scale.
+"""
+import argparse
+import os
+import sys
+import time
+
+from pypdf import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_generator import generate_payment_status_pdf, generate_payment_status_pdf_parallel  # noqa: E402
+from pdf_render import make_rows  # noqa: E402
+
+
+def page_texts(buffer):
+    return [page.extract_text() for page in PdfReader(buffer).pages]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=30000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--no-verify", action="store_true", help="skip comparing page text with the serial output")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{args.rows} rows, {os.cpu_count()} CPU(s)")
+
+    start = time.perf_counter()
+    serial = generate_payment_status_pdf(rows)
+    serial_s = time.perf_counter() - start
+    expected = None if args.no_verify else page_texts(serial)
+
+    print(f"{'workers':>8}{'pages':>8}{'seconds':>10}{'speedup':>9}  output")
+    print(f"{'serial':>8}{len(PdfReader(serial).pages):>8}{serial_s:>10.2f}{1:>9.2f}")
+    for workers in sorted(set(args.workers)):
+        start = time.perf_counter()
+        result = generate_payment_status_pdf_parallel(rows, workers=workers)
+        elapsed = time.perf_counter() - start
+        pages = len(PdfReader(result).pages)
+        check = "" if expected is None else ("identical" if page_texts(result) == expected else "DIFFERS")
+        print(f"{workers:>8}{pages:>8}{elapsed:>10.2f}{serial_s / elapsed:>9.2f}  {check}")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
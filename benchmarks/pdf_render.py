@@ -0,0 +1,88 @@
+"""Render time and size per page of the payment status PDF.
+
+    python benchmarks/pdf_render.py
+    python benchmarks/pdf_render.py --baseline 482b8be   # compare with an older pdf_generator.py
+
+Prints ms/page and bytes/page for 100, 1,000 and 10,000 rows. With
+--baseline, the pdf_generator.py of that git revision is measured as well.
+"""
+import argparse
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_generator(revision=None):
+    if revision is None:
+        path = os.path.join(ROOT, "pdf_generator.py")
+    else:
+        source = subprocess.run(
+            ["git", "show", f"{revision}:pdf_generator.py"], cwd=ROOT, check=True, capture_output=True
+        ).stdout
+        path = os.path.join(tempfile.mkdtemp(), "pdf_generator.py")
+        with open(path, "wb") as f:
+            f.write(source)
+    spec = importlib.util.spec_from_file_location(f"pdf_generator_{revision or 'current'}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.generate_payment_status_pdf
+
+
+def make_rows(count):
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "bill_no": f"V{i}",
+            "lr_no": f"LR{i}",
+            "transport_name": "Bench Transport",
+            "payment_status": "Paid" if i % 3 else "Incomplete",
+            "net_payable": 1000.0 + i,
+            # ISO strings, as posted by the frontend; older generators only accept these
+            "created_at": (start + timedelta(minutes=i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def measure(generate, rows):
+    start = time.perf_counter()
+    data = generate(rows).getvalue()
+    elapsed = time.perf_counter() - start
+    pages = len(re.findall(rb"/Type /Page\b", data))
+    return {
+        "pages": pages,
+        "ms_per_page": elapsed * 1000 / pages,
+        "bytes_per_page": len(data) / pages,
+        "total_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--baseline", help="git revision to compare against")
+    args = parser.parse_args()
+
+    generators = [("current", load_generator())]
+    if args.baseline:
+        generators.insert(0, (args.baseline, load_generator(args.baseline)))
+
+    print(f"{'version':<12}{'rows':>8}{'pages':>8}{'ms/page':>10}{'bytes/page':>12}{'total s':>10}")
+    for count in args.rows:
+        rows = make_rows(count)
+        for name, generate in generators:
+            result = measure(generate, rows)
+            print(f"{name:<12}{count:>8}{result['pages']:>8}{result['ms_per_page']:>10.2f}"
+                  f"{result['bytes_per_page']:>12.0f}{result['total_s']:>10.2f}")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Serialization cost of the list endpoints, per 10k rows.
+
+    python benchmarks/serialization.py                        # temporary 100k-bale database
+    python benchmarks/serialization.py --db bench.db --rows 200000
+
+Compares, for the bale and payment listings, how the rows used to be built
+and encoded (ORM entities, FastAPI's jsonable_encoder, json.dumps) with the
+column tuples + orjson path the routes use now, and with validating the same
+rows through the Pydantic response models. Query and encode time are
+reported separately; the outputs are checked to decode to the same JSON.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def best_of(repeat: int, fn):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def cases(rows: int):
+    import models
+    import routes
+    import schemas
+    from routes import _bale_full_to_dict, _columns, _row_dicts
+
+    bale_columns = _columns(models.VoucherBale)
+    payment_columns = _columns(models.Payment, *routes.RECENT_PAYMENT_COLUMNS, "payment_status", "quantity")
+
+    def payment_dict(p):
+        return {"id": p.id, "bill_no": p.bill_no, "lr_no": p.lr_no, "amount": p.amount,
+                "tds_percent": p.tds_percent, "net_total": p.net_total, "net_payable": p.net_payable,
+                "payment_status": p.payment_status, "quantity": p.quantity, "created_at": p.created_at}
+
+    # name -> {strategy: (load(db) -> python rows, encode(rows) -> bytes)}
+    return {
+        "/voucher-bales": {
+            "orm + jsonable_encoder": (
+                lambda db: db.query(models.VoucherBale).order_by(models.VoucherBale.id).limit(rows).all(),
+                encode_jsonable),
+            "columns + orjson": (
+                lambda db: _row_dicts(db.query(*bale_columns).order_by(models.VoucherBale.id).limit(rows)),
+                encode_orjson),
+            "columns + pydantic": (
+                lambda db: _row_dicts(db.query(*bale_columns).order_by(models.VoucherBale.id).limit(rows)),
+                encode_pydantic(List[schemas.BaleOut])),
+        },
+        "/all-voucher-bales-full": {
+            "orm dicts + jsonable_encoder": (
+                lambda db: [_bale_full_to_dict(b) for b in
+                            db.query(models.VoucherBale).order_by(models.VoucherBale.id).limit(rows)],
+                encode_jsonable),
+            "columns + orjson": (
+                lambda db: [_bale_full_to_dict(r) for r in routes._all_bales_query(db).limit(rows)],
+                encode_orjson),
+            "columns + pydantic": (
+                lambda db: [_bale_full_to_dict(r) for r in routes._all_bales_query(db).limit(rows)],
+                encode_pydantic(List[schemas.BaleDetailOut])),
+        },
+        "/payments/by-lr": {
+            "orm dicts + jsonable_encoder": (
+                lambda db: [payment_dict(p) for p in db.query(models.Payment).order_by(models.Payment.id).limit(rows)],
+                encode_jsonable),
+            "columns + orjson": (
+                lambda db: _row_dicts(db.query(*payment_columns).order_by(models.Payment.id).limit(rows)),
+                encode_orjson),
+            "columns + pydantic": (
+                lambda db: _row_dicts(db.query(*payment_columns).order_by(models.Payment.id).limit(rows)),
+                encode_pydantic(List[schemas.PaymentOut])),
+        },
+    }
+
+
+def encode_jsonable(rows) -> bytes:
+    # What FastAPI did for a returned dict: jsonable_encoder, then JSONResponse.render
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    return JSONResponse(None).render(jsonable_encoder(rows))
+
+
+def encode_orjson(rows) -> bytes:
+    from fastapi.responses import ORJSONResponse
+
+    return ORJSONResponse(None).render(rows)
+
+
+def encode_pydantic(annotation):
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(annotation)
+    return lambda rows: adapter.dump_json(adapter.validate_python(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="SQLite file from generate_data.py (copied, never modified); "
+                                     "default: generate a temporary one")
+    parser.add_argument("--rows", type=int, default=100000, help="rows per listing (at most what the database holds)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lrentry-serialization-")
+    db_path = os.path.join(workdir, "bench.db")
+    # Before anything imports database.py, which binds its engine on import
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    try:
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+        else:
+            from generate_data import generate
+            generate(f"sqlite:///{db_path}", vouchers=5000, bales_per_voucher=20, transports=40, parties=500,
+                     days=730, end=date(2025, 6, 30), accepted=0.9, seed=1,
+                     log=lambda *a: None)
+        import database
+
+        print(f"{'endpoint':<26}{'strategy':<30}{'rows':>8}{'query ms/10k':>14}{'encode ms/10k':>15}{'total':>9}")
+        for endpoint, strategies in cases(args.rows).items():
+            reference = None
+            for name, (load, encode) in strategies.items():
+                with database.SessionLocal() as db:
+                    load_s, data = best_of(args.repeat, lambda: load(db))
+                    encode_s, body = best_of(args.repeat, lambda: encode(data))
+                decoded = json.loads(body)
+                if reference is None:
+                    reference = decoded
+                elif decoded != reference:
+                    raise SystemExit(f"{endpoint}: {name} output differs from {list(strategies)[0]}")
+                per_10k = 10000 / max(1, len(data)) * 1000
+                print(f"{endpoint:<26}{name:<30}{len(data):>8}{load_s * per_10k:>14.1f}{encode_s * per_10k:>15.1f}"
+                      f"{(load_s + encode_s) * per_10k:>9.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+from sqlalchemy.orm import Session
+import models
+
+MASTER_CACHE_TTL = float(os.getenv("MASTER_CACHE_TTL", "300"))
+
+# Cached master tables, by the name of their listing endpoint
+MASTER_TABLES = {
+    "transports": models.TransportCompany,
+    "items": models.Item,
+    "units": models.QuantityUnit,
+}
+
+
+class CacheEntry(NamedTuple):
+    rows: list  # column dicts, as returned by the listing endpoint
+    by_id: dict
+    etag: str
+    expires_at: float
+
+
+class MasterDataCache:
+    """Per-process TTL cache of the small master tables.
+
+    Writes in this process invalidate their table immediately; the TTL bounds
+    how long other worker processes keep serving a stale copy.
+    """
+
+    def __init__(self, ttl: float = MASTER_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, name: str):
+        entry = self._entries.get(name)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+        return None
+
+    def load(self, db: Session, name: str) -> CacheEntry:
+        model = MASTER_TABLES[name]
+        columns = [column.name for column in model.__table__.columns]
+        rows = [
+            dict(zip(columns, row))
+            for row in db.query(*model.__table__.columns).order_by(model.id)
+        ]
+        body = json.dumps(rows, sort_keys=True, default=str).encode()
+        entry = CacheEntry(
+            rows=rows,
+            by_id={row["id"]: row for row in rows},
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            self._entries[name] = entry
+        return entry
+
+    def get(self, db: Session, name: str) -> CacheEntry:
+        return self.cached(name) or self.load(db, name)
+
+    def lookup(self, db: Session, name: str) -> "MasterLookup":
+        """Rows of ``name`` by id, for one request or export; see MasterLookup."""
+        entry = self.cached(name)
+        if entry is None:
+            return MasterLookup(self, name, self.load(db, name).by_id, db, reloaded=True)
+        return MasterLookup(self, name, entry.by_id, db)
+
+    def invalidate(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class MasterLookup:
+    """``by_id`` of one master table, reloaded once on a miss.
+
+    With several worker processes a row added through another worker is
+    missing here until this process's copy expires. The first id not found
+    reloads the table through ``db``, the session the lookup was made in, so
+    use it only while that session is: a streaming export makes its lookups
+    in its own session. Ids still missing then resolve to None.
+    """
+
+    def __init__(self, cache: MasterDataCache, name: str, by_id: dict, db: Session, reloaded: bool = False):
+        self._cache = cache
+        self._name = name
+        self._by_id = by_id
+        self._db = db
+        self._reloaded = reloaded  # True when by_id was loaded for this lookup already
+
+    def get(self, key, default=None):
+        row = self._by_id.get(key)
+        if row is None and key is not None and not self._reloaded:
+            self._reloaded = True
+            self._by_id = self._cache.load(self._db, self._name).by_id
+            row = self._by_id.get(key)
+        return default if row is None else row
+
+
+master_cache = MasterDataCache()
@@ -0,0 +1,193 @@
+"""Change feed: the ``change_log`` table behind ``/changes`` and ``/changes/stream``.
+
+Write paths call ``record`` inside their own transaction, so an entry is
+committed together with the change it describes and a client never sees one
+without the other. Entries name what changed (a voucher, the bales of a
+voucher, the payment of a bill) and the changed fields; clients re-read that
+one voucher or payment instead of polling the full listings.
+
+Each entry gets an increasing ``seq``. A client keeps the last seq it has
+applied and asks for what came after it, so an entry must never become
+visible after one with a higher seq. On SQLite writes are serialized, so seq
+order is commit order. On PostgreSQL a sequence hands out seqs in the order
+transactions ask for them, not the order they commit; ``record`` first takes
+a transaction-level advisory lock, so the next transaction recording changes
+gets its seqs only after this one has committed or rolled back.
+
+``prune`` drops entries older than CHANGE_LOG_RETENTION_DAYS; a client that
+is further behind gets told to reload.
+
+Streams in this process wake up as soon as one of its sessions commits an
+entry; entries committed by other worker processes are picked up every
+CHANGES_POLL_INTERVAL seconds.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+import orjson
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+import models
+import versions
+
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "2"))  # seconds
+STREAM_MAX_SECONDS = 300  # EventSource reconnects with Last-Event-ID; keeps shutdowns short
+KEEPALIVE_SECONDS = 15
+PAGE_SIZE = 500
+ADVISORY_LOCK_KEY = 0x6368616E  # pg_advisory_xact_lock key of change_log writers ("chan")
+
+
+def record(db: Session, entity: str, op: str, changes: Iterable):
+    """Append ``(key, data)`` entries for ``entity`` in the caller's transaction."""
+    rows = [
+        {"entity": entity, "op": op, "key": key, "data": json.dumps(data, default=str),
+         "created_at": datetime.utcnow()}
+        for key, data in changes
+    ]
+    if rows:
+        if db.get_bind().dialect.name == "postgresql":
+            # Held until commit: seq order stays commit order (see the module docstring)
+            db.execute(select(func.pg_advisory_xact_lock(ADVISORY_LOCK_KEY)))
+        db.execute(insert(models.ChangeLog.__table__), rows)
+        versions.touch(db, models.ChangeLog.__tablename__)
+        db.info["changes_recorded"] = True
+
+
+def latest_seq(db: Session) -> int:
+    return db.execute(select(func.coalesce(func.max(models.ChangeLog.seq), 0))).scalar()
+
+
+def since(db: Session, seq: int, limit: int = PAGE_SIZE):
+    """Entries after ``seq``, oldest first.
+
+    Returns ``(entries, complete)``; ``complete`` is False when entries after
+    ``seq`` have already been pruned.
+    """
+    change = models.ChangeLog
+    rows = db.execute(
+        select(change.seq, change.entity, change.key, change.op, change.data, change.created_at)
+        .where(change.seq > seq).order_by(change.seq).limit(limit)
+    ).all()
+    complete = True
+    if seq > 0 and (not rows or rows[0].seq > seq + 1):
+        oldest = db.execute(select(func.min(change.seq))).scalar()
+        complete = oldest is None or oldest <= seq + 1
+    entries = [
+        {"seq": row.seq, "entity": row.entity, "key": row.key, "op": row.op,
+         "data": json.loads(row.data) if row.data else None, "at": row.created_at}
+        for row in rows
+    ]
+    return entries, complete
+
+
+def prune(db: Session, days: int = CHANGE_LOG_RETENTION_DAYS) -> int:
+    """Delete entries older than ``days`` and commit. Returns the number deleted."""
+    deleted = db.execute(
+        delete(models.ChangeLog).where(models.ChangeLog.created_at < datetime.utcnow() - timedelta(days=days))
+    ).rowcount
+    versions.touch(db, models.ChangeLog.__tablename__)
+    db.commit()
+    return deleted
+
+
+class ChangeNotifier:
+    """Wakes the streams of this process when one of its sessions commits an entry."""
+
+    def __init__(self):
+        self._loop = None
+        self._changed = None
+        self.generation = 0  # commits seen so far
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._changed = loop.create_future()
+
+    def notify(self):
+        # Called from after_commit: on the event loop (async stack) or a threadpool thread
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.generation += 1
+        changed, self._changed = self._changed, self._loop.create_future()
+        changed.set_result(None)
+
+    async def wait(self, generation: int, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a local commit after ``generation``; False on timeout."""
+        if self.generation != generation:
+            return True
+        if self._changed is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+notifier = ChangeNotifier()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify(session):
+    if session.info.pop("changes_recorded", False):
+        notifier.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("changes_recorded", None)
+
+
+def _sse(event_name: str, data, seq: Optional[int] = None) -> str:
+    lines = [f"id: {seq}"] if seq is not None else []
+    lines += [f"event: {event_name}", f"data: {orjson.dumps(data).decode()}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(session_factory, seq: Optional[int], is_disconnected):
+    """Server-sent events: one ``change`` event per entry after ``seq``, as they are committed.
+
+    ``session_factory()`` returns a session with ``run_sync`` (see
+    database.async_session); one is opened per poll so no connection is held
+    while idle. Ends after STREAM_MAX_SECONDS, or with a ``reset`` event when
+    the client is too far behind.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_MAX_SECONDS
+    last_sent = loop.time()
+    yield f"retry: {int(CHANGES_POLL_INTERVAL * 1000)}\n\n"
+
+    while loop.time() < deadline and not await is_disconnected():
+        generation = notifier.generation  # commits after this wake the wait below
+        db = session_factory()
+        try:
+            if seq is None:
+                latest = await db.run_sync(latest_seq)
+            else:
+                entries, complete = await db.run_sync(since, seq)
+        finally:
+            await db.close()
+
+        if seq is None:
+            seq = latest
+            yield _sse("ready", {"seq": seq}, seq)
+            continue
+        if not complete:
+            yield _sse("reset", {"detail": "Changes were pruned; reload and stream from the latest seq."})
+            return
+        for entry in entries:
+            seq = entry["seq"]
+            yield _sse("change", entry, seq)
+        if entries:
+            last_sent = loop.time()
+        if len(entries) == PAGE_SIZE:
+            continue  # more waiting
+        if loop.time() - last_sent >= KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = loop.time()
+        await notifier.wait(generation, CHANGES_POLL_INTERVAL)
@@ -0,0 +1,104 @@
+import csv
+import io
+import itertools
+import json
+from datetime import date, datetime
+import orjson
+from sqlalchemy import inspect
+from fastapi.responses import StreamingResponse
+import database
+
+EXPORT_FORMATS = "^(json|ndjson|csv)$"
+YIELD_PER = 1000
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _flatten(row: dict, prefix: str = "") -> dict:
+    # Nested dicts become prefixed columns, lists are written as JSON
+    flat = {}
+    for key, value in row.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}_"))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, default=_default)
+        elif isinstance(value, (date, datetime)):
+            flat[name] = value.isoformat()
+        else:
+            flat[name] = value
+    return flat
+
+
+def query_columns(query) -> list:
+    """Column names of ``query``: the header of a CSV export that has no rows to take it from."""
+    names = []
+    for description in query.column_descriptions:
+        entity, expr = description["entity"], description["expr"]
+        if entity is not None and expr is entity:
+            names.extend(column.key for column in inspect(entity).column_attrs)
+        else:
+            names.append(description["name"])
+    return names
+
+
+def _export_body(source, format: str):
+    # Own session: yield-dependencies are closed before a streamed body is sent
+    db = database.SessionLocal()
+    try:
+        query, to_dict = source(db)
+        rows = (to_dict(row) for row in query.yield_per(YIELD_PER))
+        yield from export_lines(rows, format, query_columns(query))
+    finally:
+        db.close()
+
+
+def _ndjson_lines(rows):
+    # One chunk per YIELD_PER rows rather than per row: far fewer writes to the socket
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, YIELD_PER)):
+        yield b"".join(orjson.dumps(row, default=_default, option=orjson.OPT_APPEND_NEWLINE) for row in batch).decode()
+
+
+def _csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        row = _flatten(row)
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer is None:
+        # No rows: still a header, from the query's columns
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue()
+
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_lines(rows, format: str, columns=()):
+    """Encode an iterable of row dicts as CSV or NDJSON text chunks.
+
+    The CSV header comes from the first row; ``columns`` is written instead when there is none.
+    """
+    return _csv_lines(rows, columns) if format == "csv" else _ndjson_lines(rows)
+
+
+def stream_export(source, format: str, filename: str) -> StreamingResponse:
+    """Stream rows as NDJSON or CSV, one page of ``YIELD_PER`` at a time.
+
+    ``source(db)`` returns ``(query, to_dict)`` for the export's own session;
+    master lookups used by ``to_dict`` are made there, so they reload through it.
+    """
+    return StreamingResponse(_export_body(source, format), media_type=MEDIA_TYPES[format], headers={
+        "Content-Disposition": f"attachment; filename={filename}.{format}"
+    })
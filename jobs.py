@@ -0,0 +1,293 @@
+"""Background jobs for long-running reports and exports.
+
+Job state lives in the ``jobs`` table, so any worker process can answer status
+polls; the work itself runs in a per-process ``ProcessPoolExecutor`` and the
+result is written to a file under JOBS_DIR.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import database
+import models
+import schemas
+
+JOBS_DIR = os.path.abspath(os.getenv("JOBS_DIR", "./job_results"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "20"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))  # seconds
+PROGRESS_EVERY = 500  # rows between progress writes / cancellation checks
+
+PENDING = ("queued", "running")
+
+JOB_PARAMS = {
+    "payment_report": schemas.PaymentReportJobParams,
+    "export": schemas.ExportJobParams,
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitReached(Exception):
+    pass
+
+
+# --- Scheduling (API process) ----------------------------------------------
+
+_executor = None
+_executor_lock = threading.Lock()
+_futures = {}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: never fork a process that runs server threads and holds pooled connections
+            _executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown(wait: bool = False):
+    """Stop the job workers. Server shutdown does not wait; jobs cut short are failed at the next start."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=True)
+            _executor = None
+
+
+def dedup_key(kind: str, params: dict) -> str:
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def submit_job(db: Session, kind: str, params: dict):
+    """Queue a job, or return the identical job that is already queued/running.
+
+    Returns ``(job, created)``.
+    """
+    purge_expired(db)
+    key = dedup_key(kind, params)
+    existing = db.query(models.Job).filter(
+        models.Job.dedup_key == key, models.Job.status.in_(PENDING)
+    ).first()
+    if existing:
+        return existing, False
+
+    pending = db.query(models.Job).filter(models.Job.status.in_(PENDING)).count()
+    if pending >= JOB_MAX_PENDING:
+        raise JobLimitReached(f"{pending} job(s) already pending")
+
+    job = models.Job(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        params=json.dumps(params, default=str),
+        dedup_key=key,
+        status="queued",
+        progress=0,
+        owner_pid=os.getpid(),
+        created_at=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    future = _get_executor().submit(run_job, job.id)
+    _futures[job.id] = future
+    future.add_done_callback(lambda _: _futures.pop(job.id, None))
+    return job, True
+
+
+def cancel_job(db: Session, job: models.Job) -> models.Job:
+    if job.status not in PENDING:
+        return job
+    future = _futures.get(job.id)
+    if future is not None:
+        future.cancel()  # only succeeds while it is still queued in the pool
+    # A running job notices this at its next progress check
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job.id, models.Job.status.in_(PENDING))
+        .values(status="cancelled", finished_at=datetime.utcnow(),
+                expires_at=datetime.utcnow() + timedelta(seconds=JOB_RESULT_TTL))
+    )
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def purge_expired(db: Session):
+    now = datetime.utcnow()
+    expired = db.query(models.Job).filter(models.Job.expires_at < now).all()
+    for job in expired:
+        _remove_result(job.result_path)
+        db.delete(job)
+    if expired:
+        db.commit()
+
+
+def fail_orphaned_jobs(db: Session):
+    """Mark pending jobs whose owning process is gone as failed (e.g. after a restart)."""
+    for job in db.query(models.Job).filter(models.Job.status.in_(PENDING)).all():
+        if job.owner_pid == os.getpid() or _pid_alive(job.owner_pid):
+            continue
+        job.status = "failed"
+        job.error = "Interrupted: the server process running this job exited."
+        job.finished_at = datetime.utcnow()
+        job.expires_at = job.finished_at + timedelta(seconds=JOB_RESULT_TTL)
+    db.commit()
+
+
+def _pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_result(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def job_to_dict(job: models.Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": json.loads(job.params or "{}"),
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "result_url": f"/jobs/{job.id}/result" if job.status == "succeeded" else None
+    }
+
+
+# --- Execution (pool worker process) ----------------------------------------
+
+def _set(job_id: str, only_if_pending: bool = True, **values) -> bool:
+    with database.SessionLocal() as db:
+        stmt = update(models.Job).where(models.Job.id == job_id)
+        if only_if_pending:
+            stmt = stmt.where(models.Job.status.in_(PENDING))
+        updated = db.execute(stmt.values(**values)).rowcount
+        db.commit()
+    return bool(updated)
+
+
+def _track(rows, job_id: str):
+    """Pass rows through, recording progress and aborting once the job is cancelled."""
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count % PROGRESS_EVERY == 0 and not _set(job_id, progress=count):
+            raise JobCancelled()
+    _set(job_id, progress=count)
+
+
+VOUCHER_FILTERS = ("bill_date_from", "bill_date_to", "party_name", "transport_id")
+PAYMENT_FILTERS = ("status", "created_from", "created_to", "transport_id")
+
+
+def _export_source(db: Session, dataset: str, params: dict):
+    # Imported here: routes pulls in the whole API, which only pool workers need
+    import routes
+    from cache import master_cache
+
+    allowed = VOUCHER_FILTERS if dataset == "vouchers" else PAYMENT_FILTERS
+    filters = {key: value for key, value in params.items() if key in allowed and value is not None}
+
+    if dataset == "vouchers":
+        lookups = routes._master_lookups(db)
+        return routes._voucher_details_query(db, **filters), lambda v: routes._voucher_to_dict(v, lookups)
+    if dataset == "bales":
+        return routes._all_bales_query(db), routes._bale_full_to_dict
+    if dataset == "payments":
+        return routes._recent_payments_query(db), routes._recent_payment_to_dict
+    transports = master_cache.lookup(db, "transports")
+    return routes._payment_status_query(db, **filters), lambda row: routes._payment_status_to_dict(row, transports)
+
+
+def _run_payment_report(db: Session, job: models.Job, params: dict, path: str):
+    from pdf_generator import generate_payment_status_pdf, generate_payment_status_pdf_parallel
+
+    params = schemas.PaymentReportJobParams.model_validate(params).model_dump()
+    parallel = params.pop("parallel")
+    query, to_dict = _export_source(db, "payment_status", params)
+    _set(job.id, total=query.order_by(None).count())
+    rows = _track((to_dict(row) for row in query.yield_per(1000)), job.id)
+    with open(path, "wb") as out:
+        if parallel:
+            # Progress covers loading the rows; rendering starts once all are in
+            generate_payment_status_pdf_parallel(rows, out)
+        else:
+            generate_payment_status_pdf(rows, out)
+    return "application/pdf", "payment_status.pdf"
+
+
+def _run_export(db: Session, job: models.Job, params: dict, path: str):
+    from exports import MEDIA_TYPES, export_lines, query_columns
+
+    params = schemas.ExportJobParams.model_validate(params).model_dump()
+    dataset = params.pop("dataset")
+    format = params.pop("format")
+    query, to_dict = _export_source(db, dataset, params)
+    _set(job.id, total=query.order_by(None).count())
+    rows = _track((to_dict(row) for row in query.yield_per(1000)), job.id)
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        for chunk in export_lines(rows, format, query_columns(query)):
+            out.write(chunk)
+    return MEDIA_TYPES[format], f"{dataset}.{format}"
+
+
+JOB_RUNNERS = {
+    "payment_report": _run_payment_report,
+    "export": _run_export,
+}
+
+
+def run_job(job_id: str):
+    if not _set(job_id, status="running", started_at=datetime.utcnow()):
+        return  # cancelled while queued
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = os.path.join(JOBS_DIR, job_id)
+    with database.SessionLocal() as db:
+        job = db.get(models.Job, job_id)
+        try:
+            media_type, filename = JOB_RUNNERS[job.kind](db, job, json.loads(job.params), path + ".part")
+            os.replace(path + ".part", path)
+        except JobCancelled:
+            _remove_result(path + ".part")
+            return
+        except Exception as exc:
+            _remove_result(path + ".part")
+            finished_at = datetime.utcnow()
+            _set(job_id, status="failed", error=f"{type(exc).__name__}: {exc}", finished_at=finished_at,
+                 expires_at=finished_at + timedelta(seconds=JOB_RESULT_TTL))
+            return
+
+    finished_at = datetime.utcnow()
+    if not _set(job_id, status="succeeded", result_path=path, media_type=media_type, filename=filename,
+                finished_at=finished_at, expires_at=finished_at + timedelta(seconds=JOB_RESULT_TTL)):
+        _remove_result(path)  # cancelled just as it finished
@@ -1,17 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 import models
-from database import engine
-from routes import router as api_router
-from fastapi.staticfiles import StaticFiles
+import jobs
+import database
+import changes
+import summary
+import search
+import static
+import versions
+from metrics import TimingMiddleware, metrics
+from database import create_missing_indexes, engine
+from routes import router as api_router, scan_buffer
 import os
 
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
+create_missing_indexes(models.Base.metadata, engine)
+search.ensure_search_index(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with database.SessionLocal() as db:
+        jobs.fail_orphaned_jobs(db)
+        summary.rebuild_if_empty(db)
+        changes.prune(db)
+        versions.ensure(db)
+    changes.notifier.attach(asyncio.get_running_loop())
+    await scan_buffer.start()
+    yield
+    # Write acknowledged scans before the engines go away
+    await scan_buffer.stop()
+    jobs.shutdown()
+    # Close pooled connections; aiosqlite's connection threads keep the process alive otherwise
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    engine.dispose()
+
 
 # Initialize FastAPI
-app = FastAPI()
+# orjson encodes dicts, dates and datetimes natively; see benchmarks/serialization.py
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS Middleware for React frontend support
 app.add_middleware(
@@ -22,13 +55,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latency histograms, SQL counts and Server-Timing / X-DB-Queries headers (see metrics.py)
+app.add_middleware(TimingMiddleware)
+
+# Outermost: compresses large JSON bodies. Skips responses that already carry a
+# Content-Encoding (precompressed static files) and text/event-stream
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1024")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "5")),
+)
+
 # Include all routes from routes.py
 app.include_router(api_router)
 
 
-# ✅ Serve React Frontend Build
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ✅ Serve React Frontend Build, precompressed, with immutable caching of hashed assets (see static.py)
 if os.path.exists("web"):
-    app.mount("/", StaticFiles(directory="web", html=True), name="frontend")
+    static.prepare("web")
+    app.mount("/", static.PrecompressedStaticFiles(directory="web", html=True), name="frontend")
 
 @app.get("/")
 async def root():
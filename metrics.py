@@ -0,0 +1,164 @@
+"""Request latency and SQL metrics, rendered in the Prometheus text format.
+
+Counters are per process: with several workers (WEB_CONCURRENCY) every
+worker serves its own /metrics, so scrape them individually or aggregate.
+"""
+import contextvars
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+
+class RequestStats:
+    """SQL work done on behalf of one request, filled in by the engine hooks."""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Holds the RequestStats of the request being served. Threadpool and greenlet
+# hops copy the context, so they share (and update) the same object.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.latency = {}  # (method, route, status) -> Histogram
+        self.route_queries = {}  # (method, route) -> [queries, db seconds]
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            key = (method, route, str(status))
+            if key not in self.latency:
+                self.latency[key] = Histogram()
+            self.latency[key].observe(seconds)
+            totals = self.route_queries.setdefault((method, route), [0, 0.0])
+            totals[0] += stats.queries
+            totals[1] += stats.db_seconds
+
+    def observe_query(self, seconds: float, slow: bool):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            self.slow_queries += slow
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP lrentry_http_request_duration_seconds Request latency by route.",
+                "# TYPE lrentry_http_request_duration_seconds histogram",
+            ]
+            for (method, route, status), histogram in sorted(self.latency.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    labels = _labels(method=method, route=route, status=status, le=bound)
+                    lines.append(f"lrentry_http_request_duration_seconds_bucket{labels} {count}")
+                labels = _labels(method=method, route=route, status=status, le="+Inf")
+                lines.append(f"lrentry_http_request_duration_seconds_bucket{labels} {histogram.count}")
+                labels = _labels(method=method, route=route, status=status)
+                lines.append(f"lrentry_http_request_duration_seconds_sum{labels} {histogram.sum:.6f}")
+                lines.append(f"lrentry_http_request_duration_seconds_count{labels} {histogram.count}")
+
+            lines += [
+                "# HELP lrentry_http_db_queries_total SQL statements issued while serving a route.",
+                "# TYPE lrentry_http_db_queries_total counter",
+            ]
+            for (method, route), (queries, _) in sorted(self.route_queries.items()):
+                lines.append(f"lrentry_http_db_queries_total{_labels(method=method, route=route)} {queries}")
+            lines += [
+                "# HELP lrentry_http_db_seconds_total Time spent in SQL while serving a route.",
+                "# TYPE lrentry_http_db_seconds_total counter",
+            ]
+            for (method, route), (_, seconds) in sorted(self.route_queries.items()):
+                lines.append(f"lrentry_http_db_seconds_total{_labels(method=method, route=route)} {seconds:.6f}")
+
+            lines += [
+                "# HELP lrentry_db_queries_total SQL statements issued by this process.",
+                "# TYPE lrentry_db_queries_total counter",
+                f"lrentry_db_queries_total {self.queries}",
+                "# HELP lrentry_db_seconds_total Time spent in SQL by this process.",
+                "# TYPE lrentry_db_seconds_total counter",
+                f"lrentry_db_seconds_total {self.db_seconds:.6f}",
+                f"# HELP lrentry_db_slow_queries_total Statements slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms).",
+                "# TYPE lrentry_db_slow_queries_total counter",
+                f"lrentry_db_slow_queries_total {self.slow_queries}",
+                "# HELP lrentry_process_start_time_seconds Start time of the process since the epoch.",
+                "# TYPE lrentry_process_start_time_seconds gauge",
+                f"lrentry_process_start_time_seconds {self.started:.3f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class TimingMiddleware:
+    """Times every HTTP request and adds Server-Timing and X-DB-Queries headers.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses are not
+    buffered. SQL run while a streamed body is being sent happens after the
+    headers went out; it still reaches the /metrics totals.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", (
+                    f'app;dur={elapsed_ms:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                ).encode()))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_request.reset(token)
+            # Route templates (/jobs/{job_id}) keep the label set small; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], route, status, time.perf_counter() - start, stats)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Float, Date, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -27,11 +27,11 @@ class Voucher(Base):
     __tablename__ = "vouchers"
     id = Column(Integer, primary_key=True)
     voucher_number = Column(String, unique=True, index=True, nullable=False)
-    bill_date = Column(Date)
+    bill_date = Column(Date, index=True)
     invoice_number = Column(String, unique=True, index=True, nullable=False)
     party_name = Column(String(100))
     transport_id = Column(Integer, ForeignKey("transport_companies.id"))
-    lr_number = Column(String(50))
+    lr_number = Column(String(50), index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     quantity = Column(Float)
     unit_id = Column(Integer, ForeignKey("quantity_units.id"))
@@ -52,25 +52,85 @@ class Voucher(Base):
 class Payment(Base):
     __tablename__ = "payments"
     id = Column(Integer, primary_key=True, index=True)
-    bill_no = Column(String(50))
-    lr_no = Column(String(50))
+    bill_no = Column(String(50), index=True)
+    lr_no = Column(String(50), index=True)
     amount = Column(Float)
     tds_percent = Column(Float)
     net_total = Column(Float)
     net_payable = Column(Float)
     payment_status = Column(String(20), default="Incomplete")
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     quantity = Column(Integer)
 
 class VoucherBale(Base):
     __tablename__ = "voucher_bales"
+    __table_args__ = (
+        Index("ux_voucher_bales_voucher_bale", "voucher_number", "bale_number", unique=True),
+    )
     id = Column(Integer, primary_key=True)
-    voucher_id = Column(Integer, ForeignKey("vouchers.id"))
+    voucher_id = Column(Integer, ForeignKey("vouchers.id"), index=True)
     voucher_number = Column(String(50))
     invoice_number = Column(String(50))
-    bale_number = Column(String(50))
+    bale_number = Column(String(50), index=True)
     remarks = Column(String(100), default="Normal")
     status = Column(String(20), default="Rejected")
     quantity = Column(Float, default=0)
 
     voucher = relationship("Voucher", back_populates="bales")
+
+
+class VoucherSummary(Base):
+    """Per-voucher bale aggregates, rewritten by every write to the voucher's bales (see summary.py)."""
+    __tablename__ = "voucher_summary"
+    voucher_number = Column(String(50), primary_key=True)
+    voucher_id = Column(Integer, ForeignKey("vouchers.id"), index=True)
+    total_bales = Column(Integer, default=0)
+    accepted_bales = Column(Integer, default=0)
+    rejected_bales = Column(Integer, default=0)
+    total_quantity = Column(Float, default=0)
+    excess_bales = Column(Integer, default=0)  # remarks "Excess Quantity"
+    less_bales = Column(Integer, default=0)  # remarks "Less Quantity"
+    normal_bales = Column(Integer, default=0)  # "Normal", or any other remark
+    fully_accepted = Column(Boolean, default=False, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, default="{}")  # JSON
+    dedup_key = Column(String(64), index=True)
+    status = Column(String(20), default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    progress = Column(Integer, default=0)
+    total = Column(Integer)
+    result_path = Column(String(500))
+    media_type = Column(String(100))
+    filename = Column(String(200))
+    error = Column(Text)
+    owner_pid = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+
+class ChangeLog(Base):
+    """Append-only feed of writes, read by /changes and /changes/stream (see changes.py)."""
+    __tablename__ = "change_log"
+    # AUTOINCREMENT: pruning must never let SQLite hand out a seq a client has already seen
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)  # voucher, voucher_bales, payment
+    key = Column(String(100), nullable=False)  # voucher number / bill number
+    op = Column(String(20), nullable=False)  # insert, update, accept
+    data = Column(Text)  # JSON: the changed fields
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class TableVersion(Base):
+    """Per-table write counter, bumped on commit; the ETags of the list endpoints hash these (see versions.py)."""
+    __tablename__ = "table_versions"
+    name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow)
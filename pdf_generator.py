@@ -3,9 +3,30 @@ from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from io import BytesIO
 from datetime import datetime
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-def generate_payment_status_pdf(statuses):
-    buffer = BytesIO()
+# Cards start below the header and a new page begins once one ends under y = 120
+CARD_TOP = A4[1] - 160
+CARD_STEP = 110
+CARDS_PER_PAGE = int((CARD_TOP - 120) // CARD_STEP) + 1
+
+MIN_PAGES_PER_CHUNK = 20
+
+
+def generate_payment_status_pdf(statuses, output=None, first_index=1, first_page=1, final=True):
+    """Render payment status cards to ``output`` (a new BytesIO by default).
+
+    ``statuses`` may be any iterable, e.g. a generator over database rows; it is
+    consumed once, row by row. ``created_at`` may be a datetime or an ISO string.
+
+    ``first_index``, ``first_page`` and ``final`` render one slice of a larger
+    report: card numbers and page footers continue from the previous slice, and
+    a non-final slice does not open the page the next slice starts on.
+    """
+    buffer = output if output is not None else BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
 
@@ -13,8 +34,9 @@ def generate_payment_status_pdf(statuses):
     def draw_watermark():
         c.saveState()
         c.setFont("Helvetica-Bold", 40)
-        c.setFillColorRGB(0.8, 0.8, 0.8)
-        c.setFillAlpha(0.06)
+        # 0.8 grey at 6% opacity over the 0.1 background, pre-blended: reportlab
+        # does not carry transparency (ExtGState) resources into Form XObjects
+        c.setFillColorRGB(0.142, 0.142, 0.142)
         for x in range(0, int(width), 200):
             for y in range(0, int(height), 150):
                 c.saveState()
@@ -24,8 +46,11 @@ def generate_payment_status_pdf(statuses):
                 c.restoreState()
         c.restoreState()
 
-    # Header with watermark
-    def draw_header():
+    # Static page chrome (background, watermark, company header, copyright line).
+    # Drawn once into a Form XObject and referenced by every page with doForm.
+    def define_page_template():
+        c.beginForm("page_template")
+        c.saveState()
         c.setFillColorRGB(0.1, 0.1, 0.1)
         c.rect(0, 0, width, height, fill=1)
 
@@ -50,30 +75,68 @@ def generate_payment_status_pdf(statuses):
         c.setFillColor(colors.yellow)
         c.drawCentredString(width / 2, height - 120, "Payment Status Report")
 
-    # Footer with page number
-    def draw_footer():
         c.setFont("Helvetica", 9)
         c.setFillColor(colors.white)
-        c.drawCentredString(width / 2, 30, f"Page {c.getPageNumber()}")
         c.drawCentredString(width / 2, 15, "© 2025 Systaio Logistics Pvt. Ltd.")
+        c.restoreState()
+        c.endForm()
 
-    draw_header()
+    # Header with watermark
+    def draw_header():
+        c.doForm("page_template")
+
+    # Footer with page number
+    def draw_footer():
+        c.setFont("Helvetica", 9)
+        c.setFillColor(colors.white)
+        c.drawCentredString(width / 2, 30, f"Page {c.getPageNumber() + first_page - 1}")
 
-    y = height - 160
     padding_x = 60
+    box_height = 100
 
-    for idx, item in enumerate(statuses, start=1):
-        box_height = 100
+    # Card background and field labels, relative to the card's first baseline
+    def define_card_template():
+        c.beginForm("card_template", lowerx=0, lowery=-box_height, upperx=width, uppery=20)
+        c.saveState()
 
         # Simulate drop shadow by drawing dark rectangle behind
         c.setFillColorRGB(0.2, 0.2, 0.2)
-        c.roundRect(42, y - box_height + 8, width - 80, box_height, radius=10, fill=1)
+        c.setStrokeColor(colors.orange)
+        c.setLineWidth(1)
+        c.roundRect(42, -box_height + 8, width - 80, box_height, radius=10, fill=1)
 
         # Yellow Card
         c.setFillColor(colors.yellow)
-        c.setStrokeColor(colors.orange)
-        c.setLineWidth(1)
-        c.roundRect(40, y - box_height + 10, width - 80, box_height, radius=10, fill=1)
+        c.roundRect(40, -box_height + 10, width - 80, box_height, radius=10, fill=1)
+
+        c.setFont("Helvetica", 10)
+        c.setFillColor(colors.black)
+        for offset, label in ((20, "LR Number"), (35, "Transport Name"), (50, "Payment Status"),
+                              (65, "Net Payable"), (80, "Created At")):
+            c.drawString(padding_x, -offset, label)
+
+        c.restoreState()
+        c.endForm()
+
+    define_page_template()
+    define_card_template()
+    draw_header()
+
+    y = CARD_TOP
+    page_full = False
+
+    for idx, item in enumerate(statuses, start=first_index):
+        # Page break, deferred until there is another card to draw
+        if page_full:
+            draw_footer()
+            c.showPage()
+            draw_header()
+            y = CARD_TOP
+
+        c.saveState()
+        c.translate(0, y)
+        c.doForm("card_template")
+        c.restoreState()
 
         # Header
         c.setFont("Helvetica-Bold", 12)
@@ -83,41 +146,83 @@ def generate_payment_status_pdf(statuses):
         # Content
         c.setFont("Helvetica", 10)
         y -= 20
-        c.drawString(padding_x, y, "LR Number")
         c.drawString(padding_x + 110, y, f": {item['lr_no']}")
 
         y -= 15
-        c.drawString(padding_x, y, "Transport Name")
         c.drawString(padding_x + 110, y, f": {item['transport_name']}")
 
         y -= 15
         # Payment Status with colored label
-        c.drawString(padding_x, y, "Payment Status")
         status_color = colors.green if item['payment_status'].lower() == 'paid' else colors.red
         c.setFillColor(status_color)
         c.drawString(padding_x + 110, y, f": {item['payment_status']}")
 
         y -= 15
         c.setFillColor(colors.black)
-        c.drawString(padding_x, y, "Net Payable")
         c.drawString(padding_x + 110, y, f": Rs. {item['net_payable']}")
 
         y -= 15
-        c.drawString(padding_x, y, "Created At")
-        date_str = item['created_at'].split('T')[0]
-        formatted_date = datetime.strptime(date_str, "%Y-%m-%d").strftime("%d-%m-%Y")
+        created_at = item['created_at']
+        if isinstance(created_at, str):
+            created_at = datetime.strptime(created_at.split('T')[0], "%Y-%m-%d")
+        formatted_date = created_at.strftime("%d-%m-%Y")
         c.drawString(padding_x + 110, y, f": {formatted_date}")
 
         y -= 30
+        page_full = y < 120
 
-        # Page break
-        if y < 120:
-            draw_footer()
-            c.showPage()
-            draw_header()
-            y = height - 160
+    # A full last page is still followed by an empty one, as it always was
+    if page_full and final:
+        draw_footer()
+        c.showPage()
+        draw_header()
 
     draw_footer()
     c.save()
     buffer.seek(0)
     return buffer
+
+
+def _render_chunk(rows, first_index, first_page, final):
+    return generate_payment_status_pdf(rows, first_index=first_index, first_page=first_page, final=final).getvalue()
+
+
+def generate_payment_status_pdf_parallel(statuses, output=None, workers=None, pages_per_chunk=None):
+    """Render the same PDF as ``generate_payment_status_pdf`` across a process pool.
+
+    Rows are split into page-aligned chunks, rendered in ``workers`` processes
+    (default: one per CPU) and merged in order with pypdf. Unlike the serial
+    renderer this holds all rows, and the rendered chunks, in memory. Small
+    reports, or a single worker, are rendered serially.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    rows = list(statuses)
+    workers = workers or os.cpu_count() or 1
+    pages = math.ceil(len(rows) / CARDS_PER_PAGE)
+    if pages_per_chunk is None:
+        # A couple of chunks per worker evens out the tail without paying for many small files
+        pages_per_chunk = max(MIN_PAGES_PER_CHUNK, math.ceil(pages / (workers * 2)))
+    chunk_rows = pages_per_chunk * CARDS_PER_PAGE
+    if workers < 2 or len(rows) <= chunk_rows:
+        return generate_payment_status_pdf(rows, output)
+
+    starts = range(0, len(rows), chunk_rows)
+    # spawn: callers may be server processes with threads and open connections
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(starts)), mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = [
+            pool.submit(_render_chunk, rows[start:start + chunk_rows], start + 1,
+                        start // CARDS_PER_PAGE + 1, start + chunk_rows >= len(rows))
+            for start in starts
+        ]
+        parts = [future.result() for future in futures]
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+    buffer = output if output is not None else BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
@@ -1,57 +1,158 @@
 
-from datetime import datetime
+import asyncio
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, Body, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from pdf_generator import generate_payment_status_pdf
-import models, schemas, database
-from sqlalchemy import or_
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from pdf_generator import generate_payment_status_pdf, generate_payment_status_pdf_parallel
+from exports import EXPORT_FORMATS, stream_export
+from cache import master_cache
+from summary import refresh_voucher_summaries
+import analytics
+import changes
+import search
+import versions
+import models, schemas, database, jobs, scans
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, insert, or_, select, update
 
 
 router = APIRouter()
 
 
 # Dependency
-def get_db():
-    db = database.SessionLocal()
+async def get_db():
+    """The session of every handler; use as ``await db.run_sync(fn)`` (writes under ``database.write_lock()``).
+
+    ``fn`` receives a plain sync ``Session`` on both stacks: an ``AsyncSession``
+    on the asyncio driver when DB_ASYNC=1, otherwise the threadpool session, so
+    DB_ASYNC switches all endpoints at once. On the async stack ``fn`` runs on
+    the event loop; large listings build their response with ``_listing``.
+    """
+    db = database.async_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
-@router.post("/add-transport")
-def add_transport(data: schemas.TransportCompanyBase, db: Session=Depends(get_db)):
+def _if_none_match(request: Request) -> list:
+    # Weak comparison: W/"x" matches "x"
+    return [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+
+
+def conditional(*tables: str):
+    """Dependency: the ETag of a listing built from ``tables``; answers 304 when the client already has it.
+
+    Reads the version counters (versions.py) before the handler reads any data,
+    so a write committed in between changes the ETag the next request gets.
+    """
+    async def dependency(request: Request, db=Depends(get_db)) -> str:
+        etag = await db.run_sync(_read_etag, tables, f"{request.url.path}?{request.url.query}")
+        if etag.removeprefix("W/") in _if_none_match(request):
+            raise HTTPException(status_code=304, headers=_etag_headers(etag))
+        return etag
+    return dependency
+
+
+def _read_etag(db: Session, tables, key: str) -> str:
+    try:
+        return versions.etag(db, tables, key)
+    finally:
+        # Give the connection back before the handler's own run_sync: a request holding
+        # one while it waits for a threadpool slot starves the requests holding the slots
+        db.rollback()
+
+
+def _etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+async def _master_listing(request: Request, db, name: str):
+    entry = master_cache.cached(name) or await db.run_sync(master_cache.load, name)
+    if entry.etag in _if_none_match(request):
+        return Response(status_code=304, headers={"ETag": entry.etag})
+    return JSONResponse(entry.rows, headers={"ETag": entry.etag, "Cache-Control": "no-cache"})
+
+
+def _master_lookups(db: Session) -> dict:
+    return {name: master_cache.lookup(db, name) for name in ("transports", "items", "units")}
+
+
+def _columns(model, *names):
+    # Plain column tuples instead of ORM entities: no identity map, no per-row instance state
+    return [getattr(model, name) for name in names] if names else list(model.__table__.columns)
+
+
+def _row_dicts(rows) -> list:
+    return [row._asdict() for row in rows]
+
+
+async def _listing(db, load, build, headers=None) -> ORJSONResponse:
+    """The JSON response of a large listing: ``load(session)`` runs its queries, ``build(loaded)`` its body.
+
+    Turning thousands of rows into dicts and JSON is CPU-bound. On the sync
+    stack both steps run in one threadpool call. On the async stack run_sync
+    runs ``load`` on the event loop, so ``load`` only fetches rows; ``build``
+    and the encoding go to a worker thread after the connection is released.
+    """
+    if not database.DB_ASYNC:
+        return await db.run_sync(lambda session: ORJSONResponse(build(load(session)), headers=headers))
+    loaded = await db.run_sync(load)
+    await db.rollback()
+    return await run_in_threadpool(lambda: ORJSONResponse(build(loaded), headers=headers))
+
+
+def _resolve(lookup, keys) -> dict:
+    # Plain {id: row} for the worker thread of _listing: a miss reloads through the session, so call it in load()
+    return {key: lookup.get(key) for key in set(keys)}
+
+
+def _add_transport(db: Session, data):
     transport = models.TransportCompany(**data.dict())
     db.add(transport)
     db.commit()
     db.refresh(transport)
+    master_cache.invalidate("transports")
     return {"message": "Transport company added", "data": transport}
 
+
+@router.post("/add-transport")
+async def add_transport(data: schemas.TransportCompanyBase, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_add_transport, data)
+
 @router.get("/transports")
-def get_transports(db: Session = Depends(get_db)):
-    transports = db.query(models.TransportCompany).all()
-    return transports
+async def get_transports(request: Request, db=Depends(get_db)):
+    return await _master_listing(request, db, "transports")
 
 
-@router.post("/add-item")
-def add_item(data: schemas.ItemBase, db: Session=Depends(get_db)):
+def _add_item(db: Session, data):
     item = models.Item(**data.dict())
     db.add(item)
     db.commit()
     db.refresh(item)
+    master_cache.invalidate("items")
     return {"message": "Item added", "data": item}
 
+
+@router.post("/add-item")
+async def add_item(data: schemas.ItemBase, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_add_item, data)
+
 @router.get("/items")
-def get_items(db: Session = Depends(get_db)):
-    items = db.query(models.Item).all()
-    return items
+async def get_items(request: Request, db=Depends(get_db)):
+    return await _master_listing(request, db, "items")
 
 
 
-@router.post("/add-unit")
-def add_unit(data: schemas.QuantityUnitBase, db: Session=Depends(get_db)):
+def _add_unit(db: Session, data):
     existing = db.query(models.QuantityUnit).filter_by(quantity_unit=data.quantity_unit).first()
     if existing:
         raise HTTPException(status_code=400, detail="Unit already exists")
@@ -59,23 +160,34 @@ def add_unit(data: schemas.QuantityUnitBase, db: Session=Depends(get_db)):
     db.add(unit)
     db.commit()
     db.refresh(unit)
+    master_cache.invalidate("units")
     return {"message": "Quantity unit added", "data": unit}
 
+
+@router.post("/add-unit")
+async def add_unit(data: schemas.QuantityUnitBase, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_add_unit, data)
+
 @router.get("/units")
-def get_units(db: Session = Depends(get_db)):
-    units = db.query(models.QuantityUnit).all()
-    return units
+async def get_units(request: Request, db=Depends(get_db)):
+    return await _master_listing(request, db, "units")
 
 
 
-@router.post("/add-voucher")
-def add_voucher(voucher: schemas.VoucherCreate, db: Session = Depends(get_db)):
+def _add_voucher(db: Session, voucher):
     # Check for duplicate voucher number
     existing = db.query(models.Voucher).filter_by(voucher_number=voucher.voucher_number).first()
     if existing:
         raise HTTPException(status_code=400, detail="Voucher number already exists")
 
-    # Create and save the voucher
+    # Same check as the bulk path: a repeated bale number would hit ux_voucher_bales_voucher_bale
+    bale_numbers = [bale.bale_number for bale in voucher.bales]
+    duplicates = sorted({number for number in bale_numbers if bale_numbers.count(number) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"❌ Duplicate bale numbers in voucher: {', '.join(duplicates)}.")
+
+    # Create the voucher; voucher and bales are committed together
     new_voucher = models.Voucher(
         voucher_number=voucher.voucher_number,
         bill_date=voucher.bill_date,
@@ -96,8 +208,7 @@ def add_voucher(voucher: schemas.VoucherCreate, db: Session = Depends(get_db)):
         round_off=voucher.round_off
     )
     db.add(new_voucher)
-    db.commit()
-    db.refresh(new_voucher)
+    db.flush()  # assigns new_voucher.id
 
     for bale in voucher.bales:
         db.add(models.VoucherBale(
@@ -109,6 +220,8 @@ def add_voucher(voucher: schemas.VoucherCreate, db: Session = Depends(get_db)):
             status="Rejected"
         ))
 
+    refresh_voucher_summaries(db, [new_voucher.voucher_number])
+    changes.record(db, "voucher", "insert", [(new_voucher.voucher_number, _voucher_change(voucher))])
     db.commit()
     return {
         "message": "Voucher and bales added successfully.",
@@ -118,121 +231,464 @@ def add_voucher(voucher: schemas.VoucherCreate, db: Session = Depends(get_db)):
         }
     }
 
-@router.get("/voucher-bales")
-def get_bales(
-    voucher_number: str=Query(...),
-    db: Session=Depends(get_db)
-):
-    query = db.query(models.VoucherBale).filter(models.VoucherBale.voucher_number == voucher_number)
-    bales = query.all()
-    return {"voucher_number": voucher_number, "count": len(bales), "bales": bales}
 
+@router.post("/add-voucher")
+async def add_voucher(voucher: schemas.VoucherCreate, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_add_voucher, voucher)
 
-@router.get("/voucher-details")
-def get_all_voucher_details(db: Session=Depends(get_db)):
-    vouchers = db.query(models.Voucher).all()
+def _voucher_change(voucher: schemas.VoucherCreate) -> dict:
+    return {"bill_date": voucher.bill_date, "party_name": voucher.party_name, "transport_id": voucher.transport_id,
+            "lr_number": voucher.lr_number, "total_amount": voucher.total_amount, "bales": len(voucher.bales)}
 
-    all_data = []
 
-    for voucher in vouchers:
-        bales = db.query(models.VoucherBale).filter(
-            models.VoucherBale.voucher_number == voucher.voucher_number
-        ).all()
+BULK_CHUNK_SIZE = 500
 
-        voucher_data = {
+
+def _insert_voucher_chunk(db: Session, records):
+    """Insert one chunk of ``(index, VoucherCreate)`` records and commit it.
+
+    Returns ``(inserted_vouchers, inserted_bales, errors)``; rejected records are
+    reported by their position in the upload and do not affect the others.
+    """
+    errors = []
+    existing = db.query(models.Voucher.voucher_number, models.Voucher.invoice_number).filter(
+        or_(
+            models.Voucher.voucher_number.in_({v.voucher_number for _, v in records}),
+            models.Voucher.invoice_number.in_({v.invoice_number for _, v in records})
+        )
+    ).all()
+    taken_vouchers = {voucher_number for voucher_number, _ in existing}
+    taken_invoices = {invoice_number for _, invoice_number in existing}
+
+    valid = []
+    for index, voucher in records:
+        bale_numbers = [bale.bale_number for bale in voucher.bales]
+        if voucher.voucher_number in taken_vouchers:
+            error = "Voucher number already exists"
+        elif voucher.invoice_number in taken_invoices:
+            error = "Invoice number already exists"
+        elif len(set(bale_numbers)) != len(bale_numbers):
+            error = "Duplicate bale numbers in voucher"
+        else:
+            error = None
+
+        if error:
+            errors.append({"index": index, "voucher_number": voucher.voucher_number, "error": error})
+            continue
+        # Also catches duplicates between records of the same upload
+        taken_vouchers.add(voucher.voucher_number)
+        taken_invoices.add(voucher.invoice_number)
+        valid.append(voucher)
+
+    if not valid:
+        return 0, 0, errors
+
+    voucher_ids = dict(db.execute(
+        insert(models.Voucher).returning(models.Voucher.voucher_number, models.Voucher.id),
+        [voucher.dict(exclude={"bales"}) for voucher in valid]
+    ).all())
+
+    bale_rows = [
+        {
+            "voucher_id": voucher_ids[voucher.voucher_number],
             "voucher_number": voucher.voucher_number,
-            "bill_date": voucher.bill_date,
             "invoice_number": voucher.invoice_number,
-            "party_name": voucher.party_name,
-            "lr_number": voucher.lr_number,
-            "quantity": voucher.quantity,
-            "actual_weight": voucher.actual_weight,
-            "charged_weight": voucher.charged_weight,
-            "rate": voucher.rate,
-            "amount": voucher.amount,
-            "base_amount": voucher.base_amount,
-            "extra_charges": voucher.extra_charges,
-            "total_amount": voucher.total_amount,
-            "round_off": voucher.round_off,
-            "transport": {
-                "id": voucher.transport.id,
-                "name": voucher.transport.transport_name,
-                "rate": voucher.transport.rate
-            } if voucher.transport else None,
-            "item": {
-                "id": voucher.item.id,
-                "name": voucher.item.item_name,
-                "item_number": voucher.item.item_number
-            } if voucher.item else None,
-            "unit": {
-                "id": voucher.unit.id,
-                "name": voucher.unit.quantity_unit
-            } if voucher.unit else None,
-            "bales": [
-                {
-                    "id": bale.id,
-                    "bale_number": bale.bale_number,
-                    "quantity": bale.quantity,
-                    "status": bale.status
-                }
-                for bale in bales
-            ]
+            "bale_number": bale.bale_number,
+            "quantity": bale.quantity,
+            "remarks": "Normal",
+            "status": "Rejected"
         }
+        for voucher in valid for bale in voucher.bales
+    ]
+    if bale_rows:
+        db.execute(insert(models.VoucherBale.__table__), bale_rows)
+    versions.touch(db, models.Voucher.__tablename__, models.VoucherBale.__tablename__)
+
+    refresh_voucher_summaries(db, [voucher.voucher_number for voucher in valid])
+    changes.record(db, "voucher", "insert", [(voucher.voucher_number, _voucher_change(voucher)) for voucher in valid])
+    db.commit()
+    return len(valid), len(bale_rows), errors
+
+
+async def _iter_upload(request: Request):
+    """Yield ``(index, raw_record_or_error)`` from a JSON array or an NDJSON body."""
+    if "ndjson" in request.headers.get("content-type", ""):
+        index = 0
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if pending.strip():
+            yield index, pending
+        return
 
-        all_data.append(voucher_data)
+    try:
+        records = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="❌ Body must be a JSON array or NDJSON.")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="❌ Body must be a JSON array or NDJSON.")
+    for index, record in enumerate(records):
+        yield index, record
+
+
+@router.post("/vouchers/bulk")
+async def add_vouchers_bulk(request: Request, db=Depends(get_db)):
+    received = inserted = inserted_bales = 0
+    errors = []
+    chunk = []
+
+    async def flush():
+        nonlocal inserted, inserted_bales
+        async with database.write_lock():
+            vouchers_added, bales_added, chunk_errors = await db.run_sync(_insert_voucher_chunk, chunk)
+        inserted += vouchers_added
+        inserted_bales += bales_added
+        errors.extend(chunk_errors)
+        chunk.clear()
+
+    async for index, record in _iter_upload(request):
+        received += 1
+        try:
+            if isinstance(record, bytes):
+                record = json.loads(record)
+            chunk.append((index, schemas.VoucherCreate.model_validate(record)))
+        except ValueError as exc:
+            # ValidationError is a ValueError too
+            detail = exc.errors(include_url=False, include_context=False, include_input=False) \
+                if isinstance(exc, ValidationError) else str(exc)
+            errors.append({"index": index, "error": detail})
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
 
-    return {"count": len(all_data), "vouchers": all_data}
+    return {
+        "received": received,
+        "inserted": inserted,
+        "inserted_bales": inserted_bales,
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda e: e["index"])
+    }
 
 
-@router.patch("/accept-bales")
-def accept_selected_bales(payload: schemas.BaleAcceptRequest, db: Session=Depends(get_db)):
-    updated = 0
-    for bale_number in payload.bale_numbers:
-        bale = db.query(models.VoucherBale).filter(
-            models.VoucherBale.voucher_number == payload.voucher_number,
-            models.VoucherBale.bale_number == bale_number
-        ).first()
+@router.get("/voucher-bales", response_model=schemas.VoucherBalesResponse)
+async def get_bales(
+    voucher_number: str=Query(...),
+    etag: str=Depends(conditional("voucher_bales")),
+    db=Depends(get_db)
+):
+    bales = await db.run_sync(lambda session: _row_dicts(session.query(*_columns(models.VoucherBale)).filter(
+        models.VoucherBale.voucher_number == voucher_number
+    )))
+    return ORJSONResponse({"voucher_number": voucher_number, "count": len(bales), "bales": bales},
+                          headers=_etag_headers(etag))
+
+
+@router.get("/voucher-summary", response_model=schemas.VoucherSummaryResponse)
+async def get_voucher_summary(
+    voucher_number: Optional[str] = Query(None),
+    fully_accepted: Optional[bool] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    etag: str = Depends(conditional("voucher_summary")),
+    db=Depends(get_db)
+):
+    # Served from voucher_summary: no scan of voucher_bales
+    def load(session):
+        query = session.query(*_columns(models.VoucherSummary))
+        if voucher_number is not None:
+            query = query.filter(models.VoucherSummary.voucher_number == voucher_number)
+        if fully_accepted is not None:
+            query = query.filter(models.VoucherSummary.fully_accepted == fully_accepted)
+        if cursor is not None:
+            query = query.filter(models.VoucherSummary.voucher_number > cursor)
+        return _row_dicts(query.order_by(models.VoucherSummary.voucher_number).limit(limit))
+
+    summaries = await db.run_sync(load)
+    next_cursor = summaries[-1]["voucher_number"] if len(summaries) == limit else None
+    return ORJSONResponse({"count": len(summaries), "next_cursor": next_cursor, "vouchers": summaries},
+                          headers=_etag_headers(etag))
+
+
+@router.get("/analytics")
+async def get_analytics(
+    granularity: str = Query("month", pattern="^(day|week|month)$"),
+    group_by: str = Query("none", pattern="^(none|transport|party)$"),
+    date_from: Optional[date] = Query(None, description="bill date; widened to the start of its bucket"),
+    date_to: Optional[date] = Query(None, description="bill date, default today; widened to the end of its bucket"),
+    db=Depends(get_db)
+):
+    def load(session):
+        transports = master_cache.lookup(session, "transports")
+        return analytics.report(session, granularity, group_by, date_from, date_to, transports)
 
-        if bale and bale.status != "Accepted":
-            bale.status = "Accepted"
-            updated += 1
+    try:
+        result = await db.run_sync(load)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=f"❌ {exc}.")
+    return ORJSONResponse(result)
+
+
+@router.get("/search")
+async def search_vouchers(
+    q: str = Query(..., min_length=1, description="LR, bill, invoice or bale number, or party name; any part of it"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db=Depends(get_db)
+):
+    try:
+        results = await db.run_sync(lambda session: search.search(session, q, limit=limit + 1, offset=offset))
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=f"❌ {exc}.")
 
-    db.commit()
+    next_offset = offset + limit if len(results) > limit else None
+    return {"query": q, "count": len(results[:limit]), "next_offset": next_offset, "results": results[:limit]}
+
+
+@router.get("/changes")
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0, description="last seq applied; omit to get the current seq only"),
+    limit: int = Query(changes.PAGE_SIZE, ge=1, le=5000),
+    db=Depends(get_db)
+):
+    if since is None:
+        latest = await db.run_sync(changes.latest_seq)
+        return {"changes": [], "next_since": latest, "has_more": False}
+
+    entries, complete = await db.run_sync(changes.since, since, limit)
+    if not complete:
+        raise HTTPException(status_code=410, detail="❌ Changes after this seq were pruned; reload and start again.")
+    return ORJSONResponse({
+        "changes": entries,
+        "next_since": entries[-1]["seq"] if entries else since,
+        "has_more": len(entries) == limit
+    })
+
+
+@router.get("/changes/stream")
+async def stream_changes(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """Server-sent events for every change after ``since`` (or the Last-Event-ID a reconnecting client sends)."""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        changes.stream(database.async_session, since, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _voucher_to_dict(voucher: models.Voucher, lookups: dict, bales=None) -> dict:
+    transport = lookups["transports"].get(voucher.transport_id)
+    item = lookups["items"].get(voucher.item_id)
+    unit = lookups["units"].get(voucher.unit_id)
+    return {
+        "voucher_number": voucher.voucher_number,
+        "bill_date": voucher.bill_date,
+        "invoice_number": voucher.invoice_number,
+        "party_name": voucher.party_name,
+        "lr_number": voucher.lr_number,
+        "quantity": voucher.quantity,
+        "actual_weight": voucher.actual_weight,
+        "charged_weight": voucher.charged_weight,
+        "rate": voucher.rate,
+        "amount": voucher.amount,
+        "base_amount": voucher.base_amount,
+        "extra_charges": voucher.extra_charges,
+        "total_amount": voucher.total_amount,
+        "round_off": voucher.round_off,
+        "transport": {
+            "id": transport["id"],
+            "name": transport["transport_name"],
+            "rate": transport["rate"]
+        } if transport else None,
+        "item": {
+            "id": item["id"],
+            "name": item["item_name"],
+            "item_number": item["item_number"]
+        } if item else None,
+        "unit": {
+            "id": unit["id"],
+            "name": unit["quantity_unit"]
+        } if unit else None,
+        "bales": [
+            {
+                "id": bale.id,
+                "bale_number": bale.bale_number,
+                "quantity": bale.quantity,
+                "status": bale.status
+            }
+            for bale in (voucher.bales if bales is None else bales)
+        ]
+    }
+
+
+def _voucher_details_query(db: Session, **filters):
+    # Bales in one IN query keyed on voucher_id; transport/item/unit come from master_cache
+    return _filter_vouchers(db.query(models.Voucher).options(selectinload(models.Voucher.bales)), **filters)
+
+
+VOUCHER_BALE_COLUMNS = ("voucher_id", "id", "bale_number", "quantity", "status")
+
+
+def _voucher_details_rows(db: Session, **filters):
+    """Vouchers and their bales as column tuples: no ORM instances for the thousands of bales of a page."""
+    vouchers = _filter_vouchers(db.query(*_columns(models.Voucher)), **filters).all()
+    bales = []
+    for ids in _chunks([voucher.id for voucher in vouchers]):
+        bales += db.query(*_columns(models.VoucherBale, *VOUCHER_BALE_COLUMNS)).filter(
+            models.VoucherBale.voucher_id.in_(ids)
+        ).order_by(models.VoucherBale.id).all()
+    return vouchers, bales
+
+
+def _filter_vouchers(query, cursor=None, limit=None, bill_date_from=None,
+                     bill_date_to=None, party_name=None, transport_id=None):
+    if bill_date_from:
+        query = query.filter(models.Voucher.bill_date >= bill_date_from)
+    if bill_date_to:
+        query = query.filter(models.Voucher.bill_date <= bill_date_to)
+    if party_name:
+        query = query.filter(models.Voucher.party_name == party_name)
+    if transport_id is not None:
+        query = query.filter(models.Voucher.transport_id == transport_id)
+
+    # Keyset pagination on the primary key
+    if cursor is not None:
+        query = query.filter(models.Voucher.id > cursor)
+    query = query.order_by(models.Voucher.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+@router.get("/voucher-details")
+async def get_all_voucher_details(
+    cursor: Optional[int] = Query(None),  # next_cursor from the previous page
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    bill_date_from: Optional[date] = Query(None),
+    bill_date_to: Optional[date] = Query(None),
+    party_name: Optional[str] = Query(None),
+    transport_id: Optional[int] = Query(None),
+    format: str = Query("json", pattern=EXPORT_FORMATS),
+    etag: str = Depends(conditional("vouchers", "voucher_bales", "transport_companies", "items", "quantity_units")),
+    db=Depends(get_db)
+):
+    filters = dict(cursor=cursor, limit=limit, bill_date_from=bill_date_from,
+                   bill_date_to=bill_date_to, party_name=party_name, transport_id=transport_id)
+
+    if format != "json":
+        def source(export_db):
+            lookups = _master_lookups(export_db)
+            return _voucher_details_query(export_db, **filters), lambda voucher: _voucher_to_dict(voucher, lookups)
+
+        return stream_export(source, format, "voucher_details")
+
+    def load(session):
+        lookups = _master_lookups(session)
+        vouchers, bales = _voucher_details_rows(session, **filters)
+        return vouchers, bales, {
+            "transports": _resolve(lookups["transports"], (voucher.transport_id for voucher in vouchers)),
+            "items": _resolve(lookups["items"], (voucher.item_id for voucher in vouchers)),
+            "units": _resolve(lookups["units"], (voucher.unit_id for voucher in vouchers)),
+        }
+
+    def build(loaded):
+        vouchers, bales, lookups = loaded
+        bales_by_voucher = {}
+        for bale in bales:
+            bales_by_voucher.setdefault(bale.voucher_id, []).append(bale)
+        all_data = [_voucher_to_dict(voucher, lookups, bales_by_voucher.get(voucher.id, ())) for voucher in vouchers]
+        next_cursor = vouchers[-1].id if limit and len(vouchers) == limit else None
+        return {"count": len(all_data), "next_cursor": next_cursor, "vouchers": all_data}
+
+    return await _listing(db, load, build, headers=_etag_headers(etag))
+
+
+def _accept_bales(db: Session, voucher_number: str, bale_numbers: List[str]):
+    """Accept bales of one voucher and create its Payment once all bales are accepted.
+
+    Runs inside the caller's transaction; nothing is committed here.
+    """
+    accepted = []
+    if bale_numbers:
+        accepted = db.execute(
+            update(models.VoucherBale)
+            .where(
+                models.VoucherBale.voucher_number == voucher_number,
+                models.VoucherBale.bale_number.in_(set(bale_numbers)),
+                models.VoucherBale.status != "Accepted"
+            )
+            .values(status="Accepted")
+            .returning(models.VoucherBale.bale_number)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        versions.touch(db, models.VoucherBale.__tablename__)
+    updated = len(accepted)
 
     # Check if ALL bales are now accepted
-    all_bales = db.query(models.VoucherBale).filter(
-        models.VoucherBale.voucher_number == payload.voucher_number
-    ).all()
-    all_accepted = all(bale.status == "Accepted" for bale in all_bales)
+    total_bales, pending_bales = db.query(
+        func.count(models.VoucherBale.id),
+        func.count(models.VoucherBale.id).filter(models.VoucherBale.status != "Accepted")
+    ).filter(
+        models.VoucherBale.voucher_number == voucher_number
+    ).one()
+    all_accepted = total_bales > 0 and pending_bales == 0
 
     created_payment = None
     if all_accepted:
         voucher = db.query(models.Voucher).filter(
-            models.Voucher.voucher_number == payload.voucher_number
+            models.Voucher.voucher_number == voucher_number
+        ).first()
+        already_paid = db.query(models.Payment.id).filter(
+            models.Payment.bill_no == voucher_number
         ).first()
 
-        if voucher:
+        if voucher and not already_paid:
             tds_percent = 2.0  # Example: 2% TDS
             net_total = voucher.total_amount
             net_payable = net_total - (net_total * tds_percent / 100)
 
-            payment = models.Payment(
-    bill_no=voucher.voucher_number,
-    lr_no=voucher.lr_number,
-    amount=voucher.total_amount,
-    tds_percent=tds_percent,
-    net_total=net_total,
-    net_payable=net_payable,
-    payment_status="Incomplete",
-    quantity=voucher.quantity,
-    created_at=datetime.utcnow()
-)
+            created_payment = models.Payment(
+                bill_no=voucher.voucher_number,
+                lr_no=voucher.lr_number,
+                amount=voucher.total_amount,
+                tds_percent=tds_percent,
+                net_total=net_total,
+                net_payable=net_payable,
+                payment_status="Incomplete",
+                quantity=voucher.quantity,
+                created_at=datetime.utcnow()
+            )
+            db.add(created_payment)
+            analytics.touch(db, [voucher_number])
+            changes.record(db, "payment", "insert", [(voucher_number, {
+                "lr_no": voucher.lr_number, "net_payable": net_payable, "payment_status": "Incomplete"
+            })])
+
+    if updated:
+        refresh_voucher_summaries(db, [voucher_number])
+        changes.record(db, "voucher_bales", "accept", [(voucher_number, {"bale_numbers": accepted})])
+    return updated, created_payment
+
 
+@router.patch("/accept-bales")
+async def accept_selected_bales(payload: schemas.BaleAcceptRequest, db=Depends(get_db)):
+    def accept(session):
+        updated, created_payment = _accept_bales(session, payload.voucher_number, payload.bale_numbers)
+        session.commit()
+        if created_payment:
+            session.refresh(created_payment)
+        return updated, created_payment
 
-            db.add(payment)
-            db.commit()
-            db.refresh(payment)
-            created_payment = payment
+    async with database.write_lock():
+        updated, created_payment = await db.run_sync(accept)
 
     return {
         "message": f"{updated} bale(s) accepted for voucher '{payload.voucher_number}'.",
@@ -242,152 +698,354 @@ def accept_selected_bales(payload: schemas.BaleAcceptRequest, db: Session=Depend
     }
 
 
-@router.patch("/update-bale-quantity")
-def update_bale_quantity(data: schemas.BaleQuantityUpdate, db: Session = Depends(get_db)):
-    # Check if payment is complete
-    payment = db.query(models.Payment).filter(
-        models.Payment.bill_no == data.voucher_number,
-        models.Payment.payment_status == "Complete"
-    ).first()
+def _accept_bales_batch(db: Session, payload):
+    # Merge scans per voucher so each voucher is updated and checked once
+    bales_by_voucher = {}
+    for entry in payload.vouchers:
+        bales_by_voucher.setdefault(entry.voucher_number, []).extend(entry.bale_numbers)
 
-    if payment:
-        raise HTTPException(
-            status_code=400,
-            detail="❌ Cannot update. Payment already marked as 'Complete'."
-        )
+    results = []
+    created_payments = []
+    for voucher_number, bale_numbers in bales_by_voucher.items():
+        updated, created_payment = _accept_bales(db, voucher_number, bale_numbers)
+        if created_payment:
+            created_payments.append(created_payment)
+        results.append({
+            "voucher_number": voucher_number,
+            "accepted_count": updated,
+            "payment_created": bool(created_payment)
+        })
+
+    db.commit()
+    for payment in created_payments:
+        db.refresh(payment)
+
+    return {
+        "message": f"{sum(r['accepted_count'] for r in results)} bale(s) accepted across {len(results)} voucher(s).",
+        "results": results,
+        "payments_created": created_payments
+    }
 
-    # Update bale
-    bale = db.query(models.VoucherBale).filter(
-        models.VoucherBale.voucher_number == data.voucher_number,
-        models.VoucherBale.bale_number == data.bale_number
-    ).first()
 
-    if not bale:
-        raise HTTPException(status_code=404, detail="❌ Bale not found.")
+@router.patch("/accept-bales/batch")
+async def accept_bales_batch(payload: schemas.BaleAcceptBatchRequest, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_accept_bales_batch, payload)
 
-    bale.quantity = data.quantity
-    bale.remarks = data.remarks
+
+def _flush_scans(db: Session, bales_by_voucher: dict) -> list:
+    """One group commit for the scan buffer: each voucher is accepted and checked for its Payment once."""
+    results = []
+    for voucher_number, bale_numbers in bales_by_voucher.items():
+        updated, created_payment = _accept_bales(db, voucher_number, bale_numbers)
+        results.append({
+            "voucher_number": voucher_number,
+            "accepted_count": updated,
+            "payment_created": bool(created_payment)
+        })
     db.commit()
-    db.refresh(bale)
+    return results
+
+
+scan_buffer = scans.ScanBuffer(_flush_scans)
+
+
+@router.post("/scans", status_code=202)
+async def ingest_scans(payload: schemas.ScanBatch, wait: bool = False):
+    """Buffer gate-scanner events; they are written with the next group commit.
+
+    202 means the scans are held by the server. ``wait=true`` answers only
+    after the flush that writes them (200).
+    """
+    accepted = duplicates = 0
+    generations = set()
+    for event in payload.events:
+        added = scan_buffer.add(event.voucher_number, event.bale_numbers, event.idempotency_key)
+        accepted += added
+        duplicates += len(event.bale_numbers) - added
+        # Also duplicates of scans not written yet: pending, or in the flush running now
+        generations.add(scan_buffer.generation_of(event.voucher_number, event.bale_numbers))
+    generations.discard(None)
+
+    body = {
+        "message": f"✅ {accepted} scan(s) queued, {duplicates} duplicate(s) ignored.",
+        "accepted": accepted,
+        "duplicates": duplicates,
+        "pending": scan_buffer.pending_count
+    }
+    if not wait or not generations:
+        return body
+    # Taken before awaiting anything, while those batches are still unwritten
+    flushes = [scan_buffer.flushed(generation) for generation in sorted(generations)]
+    try:
+        batches = await asyncio.wait_for(asyncio.gather(*map(asyncio.shield, flushes)), timeout=30)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="❌ Scans are queued but the database write is delayed.")
 
-    # Recalculate total quantity for the voucher
-    all_bales = db.query(models.VoucherBale).filter(
-        models.VoucherBale.voucher_number == data.voucher_number
-    ).all()
-    total_quantity = sum(b.quantity for b in all_bales)
+    voucher_numbers = {event.voucher_number for event in payload.events}
+    results = []
+    for index, batch in enumerate(batches):
+        if all(batch is not earlier for earlier in batches[:index]):  # a failed batch is written with the next one
+            results += [result for result in batch if result["voucher_number"] in voucher_numbers]
+    return JSONResponse({**body, "pending": scan_buffer.pending_count, "flushed": results})
 
-    # Update Voucher
-    voucher = db.query(models.Voucher).filter(
-        models.Voucher.voucher_number == data.voucher_number
-    ).first()
 
-    if not voucher:
-        raise HTTPException(status_code=404, detail="❌ Voucher not found.")
+@router.get("/scans/status")
+async def scan_status():
+    return scan_buffer.status()
 
-    voucher.quantity = total_quantity
-    voucher.total_amount = total_quantity * voucher.rate
-    voucher.round_off = round(voucher.total_amount) - voucher.total_amount
-    voucher.net_payable = round(voucher.total_amount)
+
+def _update_bale_quantities(db: Session, corrections: List[schemas.BaleQuantityUpdate]):
+    """Apply bale quantity corrections and recompute each affected voucher and payment once.
+
+    Runs inside the caller's transaction; nothing is committed here. Raises
+    before writing anything if a payment is complete or a bale is missing.
+    """
+    # Last correction wins when the same bale is sent twice
+    latest = {(c.voucher_number, c.bale_number): c for c in corrections}
+    voucher_numbers = list(dict.fromkeys(voucher_number for voucher_number, _ in latest))
+
+    # Check if payment is complete
+    completed = db.execute(
+        select(models.Payment.bill_no).where(
+            models.Payment.bill_no.in_(voucher_numbers),
+            models.Payment.payment_status == "Complete"
+        ).distinct()
+    ).scalars().all()
+    if completed:
+        raise HTTPException(
+            status_code=400,
+            detail=f"❌ Cannot update. Payment already marked as 'Complete' for: {', '.join(sorted(completed))}."
+        )
+
+    existing_vouchers = set(db.execute(
+        select(models.Voucher.voucher_number).where(models.Voucher.voucher_number.in_(voucher_numbers))
+    ).scalars())
+    existing_bales = set(db.query(models.VoucherBale.voucher_number, models.VoucherBale.bale_number).filter(
+        models.VoucherBale.voucher_number.in_(voucher_numbers),
+        models.VoucherBale.bale_number.in_({bale_number for _, bale_number in latest})
+    ).tuples())
+    missing = [key for key in latest if key not in existing_bales]
+    if missing:
+        raise HTTPException(status_code=404, detail="❌ Bale not found: " + ", ".join(
+            f"{voucher_number}/{bale_number}" for voucher_number, bale_number in missing
+        ))
+    missing_vouchers = [v for v in voucher_numbers if v not in existing_vouchers]
+    if missing_vouchers:
+        raise HTTPException(status_code=404, detail=f"❌ Voucher not found: {', '.join(missing_vouchers)}.")
+
+    # Update bales, one executemany
+    bale_table = models.VoucherBale.__table__
+    db.execute(
+        update(bale_table)
+        .where(bale_table.c.voucher_number == bindparam("v_number"), bale_table.c.bale_number == bindparam("b_number"))
+        .values(quantity=bindparam("new_quantity"), remarks=bindparam("new_remarks")),
+        [
+            {"v_number": c.voucher_number, "b_number": c.bale_number,
+             "new_quantity": c.quantity, "new_remarks": c.remarks}
+            for c in latest.values()
+        ]
+    )
+    versions.touch(db, bale_table.name)
+
+    refresh_voucher_summaries(db, voucher_numbers)
+
+    # Recalculate voucher totals from the bales: UPDATE ... FROM (SELECT SUM ... GROUP BY)
+    totals = (
+        select(
+            models.VoucherBale.voucher_number,
+            func.coalesce(func.sum(models.VoucherBale.quantity), 0).label("total_quantity")
+        )
+        .where(models.VoucherBale.voucher_number.in_(voucher_numbers))
+        .group_by(models.VoucherBale.voucher_number)
+        .subquery()
+    )
+    total_amount = totals.c.total_quantity * models.Voucher.rate
+    vouchers = db.execute(
+        update(models.Voucher)
+        .where(models.Voucher.voucher_number == totals.c.voucher_number)
+        .values(
+            quantity=totals.c.total_quantity,
+            total_amount=total_amount,
+            round_off=func.round(total_amount) - total_amount
+        )
+        .returning(
+            models.Voucher.voucher_number,
+            models.Voucher.quantity.label("total_quantity"),
+            models.Voucher.total_amount,
+            func.round(models.Voucher.total_amount).label("net_payable")
+        )
+        .execution_options(synchronize_session=False)
+    ).mappings().all()
+
+    # Update Payment as well, from the voucher totals just written
+    payments = db.execute(
+        update(models.Payment)
+        .where(
+            models.Payment.bill_no == models.Voucher.voucher_number,
+            models.Voucher.voucher_number.in_(voucher_numbers)
+        )
+        .values(
+            quantity=models.Voucher.quantity,
+            net_total=models.Voucher.total_amount,
+            net_payable=func.round(models.Voucher.total_amount)
+        )
+        .returning(models.Payment.bill_no, models.Payment.quantity, models.Payment.net_total, models.Payment.net_payable)
+        .execution_options(synchronize_session=False)
+    ).mappings().all()
+    versions.touch(db, models.Voucher.__tablename__, models.Payment.__tablename__)
+
+    bales = [
+        {"voucher_number": c.voucher_number, "bale_number": c.bale_number,
+         "quantity": c.quantity, "remarks": c.remarks}
+        for c in latest.values()
+    ]
+    bales_by_voucher = {}
+    for bale in bales:
+        bales_by_voucher.setdefault(bale["voucher_number"], []).append(
+            {key: bale[key] for key in ("bale_number", "quantity", "remarks")}
+        )
+    changes.record(db, "voucher_bales", "update", [(v, {"bales": b}) for v, b in bales_by_voucher.items()])
+    changes.record(db, "voucher", "update", [
+        (v["voucher_number"], {"quantity": v["total_quantity"], "total_amount": v["total_amount"]}) for v in vouchers
+    ])
+    changes.record(db, "payment", "update", [
+        (p["bill_no"], {"quantity": p["quantity"], "net_total": p["net_total"], "net_payable": p["net_payable"]})
+        for p in payments
+    ])
+    return bales, [dict(v) for v in vouchers], [dict(p) for p in payments]
+
+
+def _update_bale_quantity(db: Session, data):
+    bales, vouchers, payments = _update_bale_quantities(db, [data])
     db.commit()
-    db.refresh(voucher)
-
-    # Update Payment as well
-    payment = db.query(models.Payment).filter(
-        models.Payment.bill_no == data.voucher_number
-    ).first()
-
-    if payment:
-        payment.quantity = total_quantity
-        payment.net_total = voucher.total_amount
-        payment.net_payable = voucher.net_payable
-        db.commit()
-        db.refresh(payment)
 
+    bale = bales[0]
     return {
         "message": f"✅ Bale '{data.bale_number}' updated successfully.",
         "updated_bale": {
-            "bale_number": bale.bale_number,
-            "quantity": bale.quantity,
-            "remarks": bale.remarks
-        },
-        "updated_voucher": {
-            "voucher_number": voucher.voucher_number,
-            "total_quantity": total_quantity,
-            "total_amount": voucher.total_amount,
-            "net_payable": voucher.net_payable
+            "bale_number": bale["bale_number"],
+            "quantity": bale["quantity"],
+            "remarks": bale["remarks"]
         },
-        "updated_payment": {
-            "bill_no": payment.bill_no,
-            "quantity": payment.quantity,
-            "net_total": payment.net_total,
-            "net_payable": payment.net_payable
-        }
+        "updated_voucher": vouchers[0],
+        "updated_payment": payments[0] if payments else None
+    }
+
+
+@router.patch("/update-bale-quantity")
+async def update_bale_quantity(data: schemas.BaleQuantityUpdate, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_update_bale_quantity, data)
+
+
+def _update_bale_quantity_batch(db: Session, payload):
+    # All or nothing: one transaction, each affected voucher recomputed once
+    bales, vouchers, payments = _update_bale_quantities(db, payload.bales)
+    db.commit()
+
+    return {
+        "message": f"✅ {len(bales)} bale(s) updated across {len(vouchers)} voucher(s).",
+        "updated_bales": bales,
+        "updated_vouchers": vouchers,
+        "updated_payments": payments
     }
 
-@router.get("/payments/recent")
-def get_recent_payments(db: Session=Depends(get_db)):
-    payments = db.query(models.Payment).order_by(
-        models.Payment.created_at.desc()
+
+@router.patch("/update-bale-quantity/batch")
+async def update_bale_quantity_batch(payload: schemas.BaleQuantityBatchUpdate, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_update_bale_quantity_batch, payload)
+
+def _recent_payment_to_dict(p) -> dict:
+    return {
+        "id": p.id,
+        "bill_no": p.bill_no,
+        "lr_no": p.lr_no,
+        "amount": p.amount,
+        "tds_percent": p.tds_percent,
+        "net_total": p.net_total,
+        "net_payable": p.net_payable,
+        "created_at": p.created_at
+    }
+
+
+RECENT_PAYMENT_COLUMNS = ("id", "bill_no", "lr_no", "amount", "tds_percent", "net_total", "net_payable", "created_at")
+
+
+def _recent_payments_query(db: Session):
+    return db.query(*_columns(models.Payment, *RECENT_PAYMENT_COLUMNS)).order_by(models.Payment.created_at.desc())
+
+
+@router.get("/payments/recent", response_model=schemas.RecentPaymentsResponse)
+async def get_recent_payments(
+    format: str = Query("json", pattern=EXPORT_FORMATS),
+    etag: str = Depends(conditional("payments")),
+    db=Depends(get_db)
+):
+    if format != "json":
+        return stream_export(
+            lambda export_db: (_recent_payments_query(export_db), _recent_payment_to_dict), format, "recent_payments"
+        )
+
+    return await _listing(
+        db, lambda session: _recent_payments_query(session).all(), lambda rows: {"payments": _row_dicts(rows)},
+        headers=_etag_headers(etag)
     )
 
+
+def _get_payment_totals(db: Session, ):
+    rows = db.query(
+        models.Payment.payment_status,
+        func.count(models.Payment.id),
+        func.coalesce(func.sum(models.Payment.amount), 0),
+        func.coalesce(func.sum(models.Payment.net_total), 0),
+        func.coalesce(func.sum(models.Payment.net_payable), 0)
+    ).group_by(models.Payment.payment_status).all()
+
+    by_status = {
+        status: {"count": count, "amount": amount, "net_total": net_total, "net_payable": net_payable}
+        for status, count, amount, net_total, net_payable in rows
+    }
+
     return {
-        "payments": [
-            {
-                "id": p.id,
-                "bill_no": p.bill_no,
-                "lr_no": p.lr_no,
-                "amount": p.amount,
-                "tds_percent": p.tds_percent,
-                "net_total": p.net_total,
-                "net_payable": p.net_payable,
-                "created_at": p.created_at
-            }
-            for p in payments
-        ]
+        "by_status": by_status,
+        "count": sum(t["count"] for t in by_status.values()),
+        "net_total": sum(t["net_total"] for t in by_status.values()),
+        "net_payable": sum(t["net_payable"] for t in by_status.values())
     }
 
 
-@router.post("/payments/by-lr")
-def get_payments_by_lr_and_bill(
+@router.get("/payments/totals")
+async def get_payment_totals(db=Depends(get_db)):
+    return await db.run_sync(_get_payment_totals, )
+
+
+@router.post("/payments/by-lr", response_model=schemas.PaymentsByLRResponse)
+async def get_payments_by_lr_and_bill(
     payload: schemas.LRAndBillRequest,
-    db: Session = Depends(get_db)
+    db=Depends(get_db)
 ):
     lr_numbers = payload.lr_numbers
     bill_numbers = payload.bill_numbers
 
-    payments = db.query(models.Payment).filter(
+    payments = await db.run_sync(lambda session: _row_dicts(session.query(
+        *_columns(models.Payment, *RECENT_PAYMENT_COLUMNS, "payment_status", "quantity")
+    ).filter(
         or_(
             models.Payment.lr_no.in_(lr_numbers),
             models.Payment.bill_no.in_(bill_numbers)
         )
-    ).all()
+    )))
 
-    return {
+    return ORJSONResponse({
         "lr_numbers": lr_numbers,
         "bill_numbers": bill_numbers,
         "count": len(payments),
-        "payments": [
-            {
-                "id": p.id,
-                "bill_no": p.bill_no,
-                "lr_no": p.lr_no,
-                "amount": p.amount,
-                "tds_percent": p.tds_percent,
-                "net_total": p.net_total,
-                "net_payable": p.net_payable,
-                "payment_status": p.payment_status,
-                "quantity": p.quantity,
-                "created_at": p.created_at
-            }
-            for p in payments
-        ]
-    }
+        "payments": payments
+    })
 
-@router.patch("/payments/mark-complete")
-def mark_payments_complete(
-    payload: schemas.LRAndBillRequest,
-    db: Session = Depends(get_db)
-):
+def _mark_payments_complete(db: Session, payload):
     from sqlalchemy import or_
     
     payments = db.query(models.Payment).filter(
@@ -406,6 +1064,7 @@ def mark_payments_complete(
             payment.payment_status = "Complete"
             updated.append(payment.bill_no)
 
+    changes.record(db, "payment", "update", [(bill_no, {"payment_status": "Complete"}) for bill_no in updated])
     db.commit()
 
     return {
@@ -414,37 +1073,108 @@ def mark_payments_complete(
         "message": "Marked payments as Complete."
     }
 
-@router.get("/payment-status")
-def get_all_payment_statuses(db: Session = Depends(get_db)):
-    payments = db.query(models.Payment).all()
-    
-    if not payments:
-        raise HTTPException(status_code=404, detail="No payments found")
-    
-    payment_statuses = []
-    
-    for payment in payments:
-        voucher = db.query(models.Voucher).filter(models.Voucher.voucher_number == payment.bill_no).first()
-        transport_name = None
-        
-        if voucher and voucher.transport:
-            transport_name = voucher.transport.transport_name
-        
-        payment_statuses.append({
-            "bill_no": payment.bill_no,
-            "lr_no": payment.lr_no,
-            "payment_status": payment.payment_status,
-            "net_payable": payment.net_payable,
-            "created_at": payment.created_at,
-            "transport_name": transport_name
-        })
-    
+
+@router.patch("/payments/mark-complete")
+async def mark_payments_complete(
+    payload: schemas.LRAndBillRequest,
+    db=Depends(get_db)
+):
+    async with database.write_lock():
+        return await db.run_sync(_mark_payments_complete, payload)
+
+def _payment_status_to_dict(row, transports: dict) -> dict:
+    transport = transports.get(row.transport_id)
     return {
-        "count": len(payment_statuses),
-        "statuses": payment_statuses
+        "bill_no": row.bill_no,
+        "lr_no": row.lr_no,
+        "payment_status": row.payment_status,
+        "net_payable": row.net_payable,
+        "created_at": row.created_at,
+        "transport_name": transport["transport_name"] if transport else None
     }
 
 
+def _payment_status_query(db: Session, cursor=None, limit=None, status=None,
+                          created_from=None, created_to=None, transport_id=None):
+    # One voucher per number: old databases may hold duplicate voucher numbers, and
+    # joining all of them would repeat the payment (same choice as voucher_summary)
+    first_voucher = select(
+        models.Voucher.voucher_number, func.min(models.Voucher.id).label("voucher_id")
+    ).group_by(models.Voucher.voucher_number).subquery()
+
+    # LEFT JOINs returning plain column tuples; transport names come from master_cache
+    query = db.query(
+        models.Payment.id,
+        models.Payment.bill_no,
+        models.Payment.lr_no,
+        models.Payment.payment_status,
+        models.Payment.net_payable,
+        models.Payment.created_at,
+        models.Voucher.transport_id
+    ).outerjoin(
+        first_voucher, first_voucher.c.voucher_number == models.Payment.bill_no
+    ).outerjoin(
+        models.Voucher, models.Voucher.id == first_voucher.c.voucher_id
+    )
+
+    if status:
+        query = query.filter(models.Payment.payment_status == status)
+    if created_from:
+        query = query.filter(models.Payment.created_at >= datetime.combine(created_from, time.min))
+    if created_to:
+        query = query.filter(models.Payment.created_at < datetime.combine(created_to + timedelta(days=1), time.min))
+    if transport_id is not None:
+        query = query.filter(models.Voucher.transport_id == transport_id)
+
+    # Keyset pagination on the primary key
+    if cursor is not None:
+        query = query.filter(models.Payment.id > cursor)
+    query = query.order_by(models.Payment.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+@router.get("/payment-status", response_model=schemas.PaymentStatusResponse)
+async def get_all_payment_statuses(
+    cursor: Optional[int] = Query(None),  # next_cursor from the previous page
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    status: Optional[str] = Query(None),  # e.g. "Complete", "Incomplete"
+    created_from: Optional[date] = Query(None),
+    created_to: Optional[date] = Query(None),
+    transport_id: Optional[int] = Query(None),
+    format: str = Query("json", pattern=EXPORT_FORMATS),
+    etag: str = Depends(conditional("payments", "vouchers", "transport_companies")),
+    db=Depends(get_db)
+):
+    filters = dict(cursor=cursor, limit=limit, status=status, created_from=created_from,
+                   created_to=created_to, transport_id=transport_id)
+
+    if format != "json":
+        def source(export_db):
+            transports = master_cache.lookup(export_db, "transports")
+            return _payment_status_query(export_db, **filters), lambda row: _payment_status_to_dict(row, transports)
+
+        return stream_export(source, format, "payment_status")
+
+    def load(session):
+        rows = _payment_status_query(session, **filters).all()
+        return rows, _resolve(master_cache.lookup(session, "transports"), (row.transport_id for row in rows))
+
+    def build(loaded):
+        rows, transports = loaded
+        if not rows and cursor is None:
+            raise HTTPException(status_code=404, detail="No payments found")
+        next_cursor = rows[-1].id if limit and len(rows) == limit else None
+        return {
+            "count": len(rows),
+            "next_cursor": next_cursor,
+            "statuses": [_payment_status_to_dict(row, transports) for row in rows]
+        }
+
+    return await _listing(db, load, build, headers=_etag_headers(etag))
+
+
 @router.post("/generate-payment-pdf")
 def generate_pdf_endpoint(data: dict):
     statuses = data.get("statuses", [])
@@ -453,55 +1183,224 @@ def generate_pdf_endpoint(data: dict):
         "Content-Disposition": "attachment; filename=payment_status.pdf"
     })
 
-@router.patch("/update-payment-quantity")
-def update_quantity_based_on_bales(request: schemas.QuantityUpdateRequest, db: Session = Depends(get_db)):
-    bale_numbers = request.bale_numbers
+REPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+REPORT_CHUNK_SIZE = 64 * 1024
 
-    # Count the number of matching bales grouped by voucher_number
-    voucher_quantity_map = {}
-    for bale_number in bale_numbers:
-        bale = db.query(models.VoucherBale).filter(models.VoucherBale.bale_number == bale_number).first()
-        if bale:
-            voucher_number = bale.voucher_number
-            if voucher_number in voucher_quantity_map:
-                voucher_quantity_map[voucher_number] += 1
+
+def _iter_spooled(spool):
+    try:
+        spool.seek(0)
+        while chunk := spool.read(REPORT_CHUNK_SIZE):
+            yield chunk
+    finally:
+        spool.close()
+
+
+@router.get("/payment-report")
+def get_payment_report_pdf(
+    status: Optional[str] = Query(None),
+    created_from: Optional[date] = Query(None),
+    created_to: Optional[date] = Query(None),
+    transport_id: Optional[int] = Query(None),
+    parallel: bool = Query(False)
+):
+    # Sync on purpose, with a session of its own: rendering is CPU-bound and must
+    # stay on a threadpool thread, where run_sync would put it on the event loop (DB_ASYNC=1)
+    spool = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE)
+    try:
+        with database.SessionLocal() as db:
+            # Same filters as /payment-status, but the rows never leave the server
+            transports = master_cache.lookup(db, "transports")
+            rows = (
+                _payment_status_to_dict(row, transports)
+                for row in _payment_status_query(
+                    db, status=status, created_from=created_from, created_to=created_to, transport_id=transport_id
+                ).yield_per(1000)
+            )
+
+            # Small reports stay in memory, large ones are spooled to a temp file
+            if parallel:
+                generate_payment_status_pdf_parallel(rows, spool)
             else:
-                voucher_quantity_map[voucher_number] = 1
+                generate_payment_status_pdf(rows, spool)
+    except Exception:
+        spool.close()
+        raise
 
-    updated = []
-    for voucher_number, qty in voucher_quantity_map.items():
-        payment = db.query(models.Payment).filter(models.Payment.bill_no == voucher_number).first()
-        if payment:
-            payment.quantity = qty
-            updated.append({"bill_no": voucher_number, "updated_quantity": qty})
+    return StreamingResponse(_iter_spooled(spool), media_type="application/pdf", headers={
+        "Content-Disposition": "attachment; filename=payment_status.pdf"
+    })
+
+def _create_job(db: Session, data):
+    try:
+        params = jobs.JOB_PARAMS[data.kind].model_validate(data.params).model_dump(mode="json", exclude_none=True)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False))
+
+    try:
+        job, created = jobs.submit_job(db, data.kind, params)
+    except jobs.JobLimitReached as exc:
+        raise HTTPException(status_code=429, detail=f"❌ Too many pending jobs: {exc}")
+
+    return {"created": created, "job": jobs.job_to_dict(job)}
+
+
+@router.post("/jobs", status_code=202)
+async def create_job(data: schemas.JobCreate, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_create_job, data)
+
+
+def _list_jobs(db: Session, limit):
+    jobs.purge_expired(db)
+    rows = db.query(models.Job).order_by(models.Job.created_at.desc()).limit(limit).all()
+    return {"count": len(rows), "jobs": [jobs.job_to_dict(job) for job in rows]}
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = Query(50, ge=1, le=500), db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_list_jobs, limit)
+
+
+def _get_job(db: Session, job_id: str) -> models.Job:
+    job = db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="❌ Job not found.")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, db=Depends(get_db)):
+    return await db.run_sync(lambda session: jobs.job_to_dict(_get_job(session, job_id)))
+
+
+def _cancel_job(db: Session, job_id):
+    job = jobs.cancel_job(db, _get_job(db, job_id))
+    return jobs.job_to_dict(job)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_cancel_job, job_id)
 
+
+def _get_job_result(db: Session, job_id):
+    job = _get_job(db, job_id)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"❌ Job is {job.status}, no result to download.")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="❌ Job result has expired.")
+    return FileResponse(job.result_path, media_type=job.media_type, filename=job.filename)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, db=Depends(get_db)):
+    return await db.run_sync(_get_job_result, job_id)
+
+
+IN_CHUNK_SIZE = 900  # bound values per IN (...); SQLite before 3.32 allows 999 in total
+
+
+def _chunks(values: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _update_quantity_based_on_bales(db: Session, request):
+    # Each scanned bale counts once, even if the scanner sent it twice
+    bale_numbers = list(dict.fromkeys(request.bale_numbers))
+
+    # Count the number of matching bales grouped by voucher_number. Bale numbers
+    # repeat across vouchers, so one scanned number counts towards every voucher holding it.
+    voucher_quantity_map = {}
+    matched = set()
+    for chunk in _chunks(bale_numbers):
+        counts = db.query(models.VoucherBale.voucher_number, func.count(models.VoucherBale.id)).filter(
+            models.VoucherBale.bale_number.in_(chunk)
+        ).group_by(models.VoucherBale.voucher_number).all()
+        for voucher_number, qty in counts:
+            voucher_quantity_map[voucher_number] = voucher_quantity_map.get(voucher_number, 0) + qty
+        matched.update(db.execute(
+            select(models.VoucherBale.bale_number).where(models.VoucherBale.bale_number.in_(chunk)).distinct()
+        ).scalars())
+
+    with_payment = set()
+    for chunk in _chunks(list(voucher_quantity_map)):
+        with_payment.update(db.execute(
+            select(models.Payment.bill_no).where(models.Payment.bill_no.in_(chunk))
+        ).scalars())
+
+    updated = [
+        {"bill_no": voucher_number, "updated_quantity": qty}
+        for voucher_number, qty in voucher_quantity_map.items() if voucher_number in with_payment
+    ]
+    if updated:
+        payments = models.Payment.__table__
+        db.execute(
+            update(payments).where(payments.c.bill_no == bindparam("voucher_number"))
+            .values(quantity=bindparam("new_quantity")),
+            [{"voucher_number": u["bill_no"], "new_quantity": u["updated_quantity"]} for u in updated]
+        )
+        versions.touch(db, payments.name)
+        changes.record(db, "payment", "update", [(u["bill_no"], {"quantity": u["updated_quantity"]}) for u in updated])
     db.commit()
 
     return {
         "message": "Quantity updated in payment table based on bale numbers.",
-        "updated": updated
+        "updated": updated,
+        "vouchers_without_payment": sorted(set(voucher_quantity_map) - with_payment),
+        "unmatched_bales": [bale_number for bale_number in bale_numbers if bale_number not in matched]
     }
 
-@router.get("/all-voucher-bales-full")
-def get_all_bale_details(db: Session = Depends(get_db)):
-    bales = db.query(models.VoucherBale).all()
 
-    if not bales:
-        raise HTTPException(status_code=404, detail="❌ No bales found.")
+@router.patch("/update-payment-quantity")
+async def update_quantity_based_on_bales(request: schemas.QuantityUpdateRequest, db=Depends(get_db)):
+    async with database.write_lock():
+        return await db.run_sync(_update_quantity_based_on_bales, request)
 
-    results = []
-    for bale in bales:
-        results.append({
-            "bale_number": bale.bale_number,
-            "quantity": bale.quantity,
-            "status": bale.status,
-            "remarks": bale.remarks or "",
-            "voucher_number": bale.voucher_number,
-            "invoice_number": bale.invoice_number,
-            "created_at": str(bale.created_at) if hasattr(bale, "created_at") else None
-        })
+def _bale_full_to_dict(bale) -> dict:
+    return {
+        "bale_number": bale.bale_number,
+        "quantity": bale.quantity,
+        "status": bale.status,
+        "remarks": bale.remarks or "",
+        "voucher_number": bale.voucher_number,
+        "invoice_number": bale.invoice_number,
+        "created_at": str(bale.created_at) if hasattr(bale, "created_at") else None
+    }
+
+
+def _all_bales_query(db: Session):
+    return db.query(*_columns(
+        models.VoucherBale, "bale_number", "quantity", "status", "remarks", "voucher_number", "invoice_number"
+    )).order_by(models.VoucherBale.id)
+
+
+def _all_bales_body(rows) -> dict:
+    results = [_bale_full_to_dict(row) for row in rows]
+
+    if not results:
+        raise HTTPException(status_code=404, detail="❌ No bales found.")
 
     return {
         "total_bales": len(results),
         "bales": results
     }
+
+
+@router.get("/all-voucher-bales-full", response_model=schemas.AllBalesResponse)
+async def get_all_bale_details(
+    format: str = Query("json", pattern=EXPORT_FORMATS),
+    etag: str = Depends(conditional("voucher_bales")),
+    db=Depends(get_db)
+):
+    if format != "json":
+        return stream_export(
+            lambda export_db: (_all_bales_query(export_db), _bale_full_to_dict), format, "voucher_bales"
+        )
+
+    return await _listing(
+        db, lambda session: _all_bales_query(session).all(), _all_bales_body, headers=_etag_headers(etag)
+    )
@@ -0,0 +1,247 @@
+"""Write-behind buffer for gate-scanner bale scans (``POST /scans``).
+
+Scans are acknowledged as soon as they are in memory and written to the
+database in group commits: every SCAN_FLUSH_INTERVAL seconds, or as soon as
+SCAN_FLUSH_BATCH bales are pending. Resent scans are dropped before they reach
+the database, by client idempotency key and by (voucher, bale), so one flush
+runs each voucher's accept / all-accepted -> Payment logic once.
+
+The buffer lives in the event loop of one worker process. The lifespan
+flushes it on shutdown; a crash loses the scans acknowledged since the last
+flush (at most one interval's worth). Scans of one voucher hitting several
+workers are still safe: accepting an accepted bale is a no-op and a
+voucher's Payment is only created once.
+
+A failed flush puts its batch back and is retried. After SCAN_FLUSH_RETRIES
+failures in a row the batch is written one voucher per transaction instead,
+and the vouchers that still fail are dropped and reported (``/scans/status``)
+rather than blocking every later scan.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+import database
+
+SCAN_FLUSH_INTERVAL = float(os.getenv("SCAN_FLUSH_INTERVAL", "0.25"))  # seconds
+SCAN_FLUSH_BATCH = int(os.getenv("SCAN_FLUSH_BATCH", "500"))  # pending bales that trigger an early flush
+SCAN_IDEMPOTENCY_TTL = float(os.getenv("SCAN_IDEMPOTENCY_TTL", "900"))  # seconds a key is remembered
+SCAN_FLUSH_RETRIES = int(os.getenv("SCAN_FLUSH_RETRIES", "3"))  # failed group commits before going per voucher
+SCAN_RECENT_BALES = 100000  # flushed (voucher, bale) pairs remembered to drop rescans
+SCAN_DROPPED_KEPT = 100  # dropped vouchers listed in status()
+
+log = logging.getLogger(__name__)
+
+
+class _Expiring(OrderedDict):
+    """Insertion-ordered keys with a TTL (or a size cap); oldest entries are evicted first."""
+
+    def __init__(self, ttl=None, max_size=None):
+        super().__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def add(self, key):
+        self[key] = time.monotonic()
+        self.move_to_end(key)
+        self.prune()
+
+    def prune(self):
+        now = time.monotonic()
+        while self and (
+            (self.max_size and len(self) > self.max_size)
+            or (self.ttl and next(iter(self.values())) < now - self.ttl)
+        ):
+            self.popitem(last=False)
+
+
+class ScanBuffer:
+    def __init__(self, flush_fn, interval: float = SCAN_FLUSH_INTERVAL, batch_size: int = SCAN_FLUSH_BATCH):
+        """``flush_fn(session, {voucher_number: [bale_numbers]})`` writes one group commit and returns a result list."""
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = {}  # voucher_number -> {bale_number: None}, in arrival order
+        self.pending_count = 0
+        self.in_flight = {}  # the batch being written, same shape
+        # Batches are numbered: ``pending`` is batch ``generation``, ``in_flight`` the one before
+        self.generation = 0
+        self.failures = 0  # failed flushes in a row
+        self.dropped = deque(maxlen=SCAN_DROPPED_KEPT)
+        self.keys = _Expiring(ttl=SCAN_IDEMPOTENCY_TTL)
+        self.recent = _Expiring(max_size=SCAN_RECENT_BALES)
+        self.stats = {"received": 0, "duplicates": 0, "flushed_bales": 0, "flushes": 0,
+                      "failed_flushes": 0, "dropped_bales": 0, "payments_created": 0, "last_flush": None}
+        self._wake = None
+        self._waiters = {}  # generation -> future resolved with the results of the flush that wrote it
+        self._task = None
+        self._flush_lock = None
+        self._stopping = False
+
+    # --- lifecycle (lifespan) ---
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write everything still pending."""
+        if self._task is None:
+            return
+        # Not cancel(): a flush cancelled mid-write would keep running in its
+        # thread while its batch is dropped here
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        # Ends: after SCAN_FLUSH_RETRIES failures the batch is written or dropped voucher by voucher
+        while self.pending:
+            await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self.pending and not self._stopping:
+                if not await self.flush():
+                    await asyncio.sleep(self.interval)  # back off; the scans stay pending
+
+    # --- ingestion ---
+
+    def add(self, voucher_number: str, bale_numbers, idempotency_key=None) -> int:
+        """Buffer one scan event; returns how many of its bales were new.
+
+        An event whose idempotency key was already seen is dropped as a whole.
+        """
+        self.stats["received"] += 1
+        if idempotency_key is not None:
+            self.keys.prune()
+            if idempotency_key in self.keys:
+                self.stats["duplicates"] += 1
+                return 0
+            self.keys.add(idempotency_key)
+
+        bales = self.pending.setdefault(voucher_number, {})
+        in_flight = self.in_flight.get(voucher_number, ())
+        added = 0
+        for bale_number in bale_numbers:
+            if bale_number in bales or bale_number in in_flight or (voucher_number, bale_number) in self.recent:
+                continue
+            bales[bale_number] = None
+            added += 1
+        if not bales:
+            del self.pending[voucher_number]
+        if not added:
+            self.stats["duplicates"] += 1
+        self.pending_count += added
+        if self.pending_count >= self.batch_size and self._wake is not None:
+            self._wake.set()
+        return added
+
+    def generation_of(self, voucher_number: str, bale_numbers):
+        """The batch that writes these bales: pending, in flight, or None when already written."""
+        if any(bale_number in self.pending.get(voucher_number, ()) for bale_number in bale_numbers):
+            return self.generation
+        if any(bale_number in self.in_flight.get(voucher_number, ()) for bale_number in bale_numbers):
+            return self.generation - 1
+        return None
+
+    def flushed(self, generation: int) -> asyncio.Future:
+        """Future resolved with the results of the flush that writes batch ``generation`` (see generation_of).
+
+        Shared between callers: await it through ``asyncio.shield``.
+        """
+        if generation not in self._waiters:
+            self._waiters[generation] = asyncio.get_running_loop().create_future()
+        return self._waiters[generation]
+
+    # --- writing ---
+
+    async def flush(self) -> bool:
+        """Write the pending batch; False when it failed and was put back."""
+        async with self._flush_lock:
+            if not self.pending:
+                return True
+            batch, count, generation = self.pending, self.pending_count, self.generation
+            self.in_flight = batch
+            self.pending, self.pending_count = {}, 0
+            self.generation += 1
+            bales_by_voucher = {voucher_number: list(bales) for voucher_number, bales in batch.items()}
+
+            started = time.perf_counter()
+            try:
+                if self.failures < SCAN_FLUSH_RETRIES:
+                    results = await self._write(bales_by_voucher)
+                else:
+                    results = await self._write_per_voucher(bales_by_voucher)
+            except Exception:
+                self.failures += 1
+                log.exception("Scan flush of %d bale(s) failed (%d in a row); retrying", count, self.failures)
+                self.stats["failed_flushes"] += 1
+                # Put the batch back in front of anything that arrived meanwhile; it is written
+                # with the current pending batch, whose flush also resolves this one's waiters
+                for voucher_number, bales in self.pending.items():
+                    batch.setdefault(voucher_number, {}).update(bales)
+                self.pending = batch
+                self.pending_count = sum(len(bales) for bales in batch.values())
+                return False
+            finally:
+                self.in_flight = {}
+            self.failures = 0
+
+            for result in results:
+                if "error" not in result:
+                    for bale_number in bales_by_voucher[result["voucher_number"]]:
+                        self.recent.add((result["voucher_number"], bale_number))
+            self.stats["flushes"] += 1
+            self.stats["flushed_bales"] += count
+            self.stats["payments_created"] += sum(1 for r in results if r.get("payment_created"))
+            self.stats["last_flush"] = {
+                "at": time.time(), "vouchers": len(bales_by_voucher), "bales": count,
+                "ms": round((time.perf_counter() - started) * 1000, 1), "results": results,
+            }
+
+            # Batches merged into this one after failing are written too
+            for waiting in [g for g in self._waiters if g <= generation]:
+                self._waiters.pop(waiting).set_result(results)
+            return True
+
+    async def _write(self, bales_by_voucher: dict) -> list:
+        db = database.async_session()
+        try:
+            async with database.write_lock():
+                return await db.run_sync(self.flush_fn, bales_by_voucher)
+        finally:
+            await db.close()
+
+    async def _write_per_voucher(self, bales_by_voucher: dict) -> list:
+        """One transaction per voucher; a voucher that fails again is dropped and reported."""
+        results = []
+        for voucher_number, bale_numbers in bales_by_voucher.items():
+            try:
+                results += await self._write({voucher_number: bale_numbers})
+            except Exception as exc:
+                log.exception("Dropping %d scan(s) of voucher %s", len(bale_numbers), voucher_number)
+                self.stats["dropped_bales"] += len(bale_numbers)
+                dropped = {"voucher_number": voucher_number, "bale_numbers": bale_numbers, "error": str(exc)}
+                self.dropped.append({**dropped, "at": time.time()})
+                results.append(dropped)
+        return results
+
+    def status(self) -> dict:
+        return {
+            "pending_vouchers": len(self.pending),
+            "pending_bales": self.pending_count,
+            "flush_interval_ms": self.interval * 1000,
+            "flush_batch": self.batch_size,
+            "in_flight_bales": sum(len(bales) for bales in self.in_flight.values()),
+            **{key: value for key, value in self.stats.items() if key != "last_flush"},
+            "last_flush": {key: value for key, value in (self.stats["last_flush"] or {}).items() if key != "results"}
+                          or None,
+            "dropped": list(self.dropped),
+        }
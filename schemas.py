@@ -1,6 +1,6 @@
-from datetime import date
-from typing import List
-from pydantic import BaseModel
+from datetime import date, datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 class TransportCompanyBase(BaseModel):
     transport_name: str
@@ -48,12 +48,26 @@ class BaleAcceptRequest(BaseModel):
     voucher_number: str
     bale_numbers: List[str]  # List of bale numbers to accept
 
+class BaleAcceptBatchRequest(BaseModel):
+    vouchers: List[BaleAcceptRequest]  # buffered scans from gate scanners
+
+class ScanEvent(BaseModel):
+    voucher_number: str
+    bale_numbers: List[str] = Field(..., min_length=1)
+    idempotency_key: Optional[str] = Field(None, max_length=200)  # resends with the same key are ignored
+
+class ScanBatch(BaseModel):
+    events: List[ScanEvent] = Field(..., min_length=1, max_length=5000)
+
 class BaleQuantityUpdate(BaseModel):
     voucher_number: str
     bale_number: str
     quantity: float
     remarks: str  # e.g. "Excess Quantity", "Less Quantity", "Normal"
 
+class BaleQuantityBatchUpdate(BaseModel):
+    bales: List[BaleQuantityUpdate] = Field(..., min_length=1)  # weighbridge corrections
+
 class QuantityUpdateRequest(BaseModel):
     bale_numbers: List[str]  # list of bale numbers
 
@@ -61,3 +75,110 @@ class LRAndBillRequest(BaseModel):
     lr_numbers: List[str]
     bill_numbers: List[str]
 
+class JobCreate(BaseModel):
+    kind: Literal["payment_report", "export"]
+    params: dict = {}
+
+class PaymentFilterParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    status: Optional[str] = None
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
+    transport_id: Optional[int] = None
+
+class PaymentReportJobParams(PaymentFilterParams):
+    parallel: bool = False  # render page chunks across a process pool
+
+class ExportJobParams(PaymentFilterParams):
+    dataset: Literal["vouchers", "bales", "payments", "payment_status"]
+    format: Literal["csv", "ndjson"] = "ndjson"
+    # vouchers only; the payment filters above apply to payment_status
+    bill_date_from: Optional[date] = None
+    bill_date_to: Optional[date] = None
+    party_name: Optional[str] = None
+
+
+# Response models. List endpoints build their rows from column tuples and
+# encode them with orjson directly; these describe those rows in the OpenAPI schema.
+
+class BaleOut(BaseModel):
+    id: int
+    voucher_id: Optional[int] = None
+    voucher_number: Optional[str] = None
+    invoice_number: Optional[str] = None
+    bale_number: Optional[str] = None
+    remarks: Optional[str] = None
+    status: Optional[str] = None
+    quantity: Optional[float] = None
+
+class VoucherBalesResponse(BaseModel):
+    voucher_number: str
+    count: int
+    bales: List[BaleOut]
+
+class BaleDetailOut(BaseModel):
+    bale_number: Optional[str] = None
+    quantity: Optional[float] = None
+    status: Optional[str] = None
+    remarks: str
+    voucher_number: Optional[str] = None
+    invoice_number: Optional[str] = None
+    created_at: Optional[str] = None  # bales carry no timestamp; always null
+
+class AllBalesResponse(BaseModel):
+    total_bales: int
+    bales: List[BaleDetailOut]
+
+class VoucherSummaryOut(BaseModel):
+    voucher_number: str
+    voucher_id: Optional[int] = None
+    total_bales: int
+    accepted_bales: int
+    rejected_bales: int
+    total_quantity: float
+    excess_bales: int
+    less_bales: int
+    normal_bales: int
+    fully_accepted: bool
+    updated_at: Optional[datetime] = None
+
+class VoucherSummaryResponse(BaseModel):
+    count: int
+    next_cursor: Optional[str] = None
+    vouchers: List[VoucherSummaryOut]
+
+class RecentPaymentOut(BaseModel):
+    id: int
+    bill_no: Optional[str] = None
+    lr_no: Optional[str] = None
+    amount: Optional[float] = None
+    tds_percent: Optional[float] = None
+    net_total: Optional[float] = None
+    net_payable: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+class RecentPaymentsResponse(BaseModel):
+    payments: List[RecentPaymentOut]
+
+class PaymentOut(RecentPaymentOut):
+    payment_status: Optional[str] = None
+    quantity: Optional[int] = None
+
+class PaymentsByLRResponse(BaseModel):
+    lr_numbers: List[str]
+    bill_numbers: List[str]
+    count: int
+    payments: List[PaymentOut]
+
+class PaymentStatusOut(BaseModel):
+    bill_no: Optional[str] = None
+    lr_no: Optional[str] = None
+    payment_status: Optional[str] = None
+    net_payable: Optional[float] = None
+    created_at: Optional[datetime] = None
+    transport_name: Optional[str] = None
+
+class PaymentStatusResponse(BaseModel):
+    count: int
+    next_cursor: Optional[int] = None
+    statuses: List[PaymentStatusOut]
@@ -0,0 +1,197 @@
+"""Substring search over vouchers and bales, behind ``GET /search``.
+
+On SQLite two FTS5 tables with the trigram tokenizer index the identifiers:
+``voucher_search`` holds one row per voucher (voucher, LR and invoice number,
+party name) and ``bale_search`` one row per bale number. Both are
+external-content tables: they store only the index and read the text from
+vouchers / voucher_bales. Triggers keep them in step with every write,
+ORM or bulk, inside the writing transaction. Bale status changes do not
+touch the index.
+
+Other databases fall back to LIKE scans (on PostgreSQL, add pg_trgm GIN
+indexes on the same columns to make those fast).
+"""
+import logging
+from sqlalchemy import and_, case, column, func, or_, select, table, text
+from sqlalchemy.orm import Session
+import models
+
+MIN_QUERY_LENGTH = 3  # shortest term the trigram index can look up
+
+VOUCHER_FIELDS = ("voucher_number", "lr_number", "invoice_number", "party_name")
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS voucher_search USING fts5("
+    "voucher_number, lr_number, invoice_number, party_name, "
+    "content='vouchers', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bale_search USING fts5("
+    "bale_number, content='voucher_bales', content_rowid='id', tokenize='trigram', detail='none')",
+
+    "CREATE TRIGGER IF NOT EXISTS vouchers_search_insert AFTER INSERT ON vouchers BEGIN "
+    "INSERT INTO voucher_search(rowid, voucher_number, lr_number, invoice_number, party_name) "
+    "VALUES (new.id, new.voucher_number, new.lr_number, new.invoice_number, new.party_name); END",
+    "CREATE TRIGGER IF NOT EXISTS vouchers_search_delete AFTER DELETE ON vouchers BEGIN "
+    "INSERT INTO voucher_search(voucher_search, rowid, voucher_number, lr_number, invoice_number, party_name) "
+    "VALUES ('delete', old.id, old.voucher_number, old.lr_number, old.invoice_number, old.party_name); END",
+    "CREATE TRIGGER IF NOT EXISTS vouchers_search_update "
+    "AFTER UPDATE OF voucher_number, lr_number, invoice_number, party_name ON vouchers BEGIN "
+    "INSERT INTO voucher_search(voucher_search, rowid, voucher_number, lr_number, invoice_number, party_name) "
+    "VALUES ('delete', old.id, old.voucher_number, old.lr_number, old.invoice_number, old.party_name); "
+    "INSERT INTO voucher_search(rowid, voucher_number, lr_number, invoice_number, party_name) "
+    "VALUES (new.id, new.voucher_number, new.lr_number, new.invoice_number, new.party_name); END",
+
+    "CREATE TRIGGER IF NOT EXISTS voucher_bales_search_insert AFTER INSERT ON voucher_bales BEGIN "
+    "INSERT INTO bale_search(rowid, bale_number) VALUES (new.id, new.bale_number); END",
+    "CREATE TRIGGER IF NOT EXISTS voucher_bales_search_delete AFTER DELETE ON voucher_bales BEGIN "
+    "INSERT INTO bale_search(bale_search, rowid, bale_number) VALUES ('delete', old.id, old.bale_number); END",
+    "CREATE TRIGGER IF NOT EXISTS voucher_bales_search_update AFTER UPDATE OF bale_number ON voucher_bales BEGIN "
+    "INSERT INTO bale_search(bale_search, rowid, bale_number) VALUES ('delete', old.id, old.bale_number); "
+    "INSERT INTO bale_search(rowid, bale_number) VALUES (new.id, new.bale_number); END",
+)
+
+voucher_search = table("voucher_search", column("rowid"))
+bale_search = table("bale_search", column("rowid"), column("bale_number"))
+
+
+def uses_fts(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_index(engine):
+    """Create the FTS tables and triggers if missing; a new index is filled from the existing rows."""
+    if not uses_fts(engine):
+        return
+    with engine.begin() as conn:
+        existing = set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE name IN ('voucher_search', 'bale_search')"
+        )).scalars())
+        for statement in SQLITE_SCHEMA:
+            conn.execute(text(statement))
+        if len(existing) < 2:
+            logging.getLogger(__name__).info("Building the search index ...")
+            rebuild(conn)
+
+
+def rebuild(conn):
+    """Re-read every voucher and bale into the index."""
+    conn.execute(text("INSERT INTO voucher_search(voucher_search) VALUES ('rebuild')"))
+    conn.execute(text("INSERT INTO bale_search(bale_search) VALUES ('rebuild')"))
+
+
+def check(conn):
+    """Raise if the index disagrees with the vouchers / voucher_bales rows."""
+    conn.execute(text("INSERT INTO voucher_search(voucher_search, rank) VALUES ('integrity-check', 1)"))
+    conn.execute(text("INSERT INTO bale_search(bale_search, rank) VALUES ('integrity-check', 1)"))
+
+
+def query_terms(q: str) -> list:
+    return [term for term in q.lower().split() if term]
+
+
+def _split_terms(terms: list):
+    # Terms too short for the trigram index are checked with LIKE on the index's hits
+    return ([t for t in terms if len(t) >= MIN_QUERY_LENGTH], [t for t in terms if len(t) < MIN_QUERY_LENGTH])
+
+
+def _match_expression(terms: list) -> str:
+    # Each term is a quoted phrase, i.e. a substring; terms are ANDed
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _score(columns, q: str):
+    """0 for an exact match on any column, 1 for a prefix match, 2 for a substring."""
+    prefix = _like_escape(q) + "%"
+    return case(
+        (or_(*(func.lower(c) == q for c in columns)), 0),
+        (or_(*(func.lower(c).like(prefix, escape="\\") for c in columns)), 1),
+        else_=2
+    )
+
+
+def _contains_all(columns, terms: list):
+    # LIKE fallback: every term appears in one of the columns
+    return and_(*(
+        or_(*(func.lower(c).like(f"%{_like_escape(term)}%", escape="\\") for c in columns)) for term in terms
+    ))
+
+
+def _voucher_hits(db: Session, q: str, terms: list, limit: int):
+    voucher = models.Voucher
+    columns = [getattr(voucher, field) for field in VOUCHER_FIELDS]
+    query = select(
+        voucher.id, *columns, voucher.bill_date, voucher.transport_id, _score(columns, q).label("score")
+    )
+    if uses_fts(db.get_bind()):
+        indexed, short = _split_terms(terms)
+        query = query.join(voucher_search, voucher_search.c.rowid == voucher.id).where(
+            text("voucher_search MATCH :match").bindparams(match=_match_expression(indexed))
+        ).order_by("score", text("bm25(voucher_search)"), voucher.id.desc())
+        if short:
+            query = query.where(_contains_all(columns, short))
+    else:
+        query = query.where(_contains_all(columns, terms)).order_by("score", voucher.id.desc())
+    return db.execute(query.limit(limit)).all()
+
+
+def _bale_hits(db: Session, q: str, terms: list, limit: int):
+    bale, voucher = models.VoucherBale, models.Voucher
+    query = select(
+        bale.id.label("bale_id"), bale.bale_number, bale.status, bale.quantity, bale.voucher_id,
+        *(getattr(voucher, field) for field in VOUCHER_FIELDS), voucher.bill_date,
+        _score([bale.bale_number], q).label("score")
+    ).outerjoin(voucher, voucher.id == bale.voucher_id)
+    if uses_fts(db.get_bind()):
+        # detail=none keeps the index small but has no phrase MATCH; the trigram
+        # tokenizer answers LIKE from the index instead (unless ESCAPE is needed)
+        term = terms[0]
+        if "%" in term or "_" in term:
+            condition = bale_search.c.bale_number.like(f"%{_like_escape(term)}%", escape="\\")
+        else:
+            condition = bale_search.c.bale_number.like(f"%{term}%")
+        query = query.join(bale_search, bale_search.c.rowid == bale.id).where(condition)
+    else:
+        query = query.where(_contains_all([bale.bale_number], terms))
+    return db.execute(query.order_by("score", bale.id.desc()).limit(limit)).all()
+
+
+def _matched(row, fields, terms) -> list:
+    return [field for field in fields if any(term in (getattr(row, field) or "").lower() for term in terms)]
+
+
+def search(db: Session, q: str, limit: int = 20, offset: int = 0) -> list:
+    """Ranked voucher and bale hits for ``q``: exact, then prefix, then substring matches.
+
+    Returns up to ``limit`` result dicts after skipping ``offset``. Raises
+    ValueError unless one term has at least MIN_QUERY_LENGTH characters.
+    """
+    terms = query_terms(q)
+    if not _split_terms(terms)[0]:
+        raise ValueError(f"Search for at least {MIN_QUERY_LENGTH} characters")
+    q = " ".join(terms)
+    wanted = offset + limit
+    hits = [(row.score, 0, "voucher", row) for row in _voucher_hits(db, q, terms, wanted)]
+    # Bale numbers hold no spaces, so multi-word queries (party names) only match vouchers
+    if len(terms) == 1:
+        hits += [(row.score, 1, "bale", row) for row in _bale_hits(db, q, terms, wanted)]
+    # Stable sort: each kind keeps its SQL order (bm25 / newest first) within a score
+    hits.sort(key=lambda hit: hit[:2])
+
+    results = []
+    for _, _, kind, row in hits[offset:wanted]:
+        result = {
+            "type": kind,
+            "voucher_id": row.id if kind == "voucher" else row.voucher_id,
+            **{field: getattr(row, field) for field in VOUCHER_FIELDS},
+            "bill_date": row.bill_date,
+        }
+        if kind == "bale":
+            result.update(bale_id=row.bale_id, bale_number=row.bale_number, status=row.status, quantity=row.quantity)
+            result["matched"] = ["bale_number"]
+        else:
+            result["matched"] = _matched(row, VOUCHER_FIELDS, terms)
+        results.append(result)
+    return results
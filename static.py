@@ -0,0 +1,131 @@
+"""Serving the React build in ``web/``: precompressed variants and cache headers.
+
+``precompress`` writes ``<file>.gz`` (and ``<file>.br`` when the optional
+``brotli`` package is installed) next to every compressible file. main.py runs
+it at startup and skips files whose variants are up to date; a build step can
+run it ahead of time instead (``python static.py web``), e.g. for a read-only
+deployment.
+
+``PrecompressedStaticFiles`` serves the best variant the client accepts, with
+Content-Encoding and Vary set, instead of compressing the same file on every
+request. Content-hashed build files (``main.38c21849.js``) never change under
+their name and are sent with ``Cache-Control: immutable``; everything else
+(index.html, manifest.json) is revalidated with its ETag / Last-Modified.
+"""
+import gzip
+import logging
+import os
+import re
+import sys
+from mimetypes import guess_type
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # optional: .gz variants only
+    brotli = None
+
+COMPRESSIBLE = (".js", ".css", ".html", ".map", ".json", ".svg", ".txt", ".ico", ".webmanifest")
+MIN_SIZE = 1024  # smaller files gain nothing from compression
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")  # CRA / webpack content hash, e.g. main.38c21849.js
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compressors():
+    compressors = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors[".br"] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+def precompress(directory: str) -> int:
+    """Write missing or stale compressed variants under ``directory``. Returns how many were written."""
+    written = 0
+    compressors = _compressors()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+            data = None
+            for suffix, compress in compressors.items():
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as source:
+                        data = source.read()
+                # Via a temporary file: a request never sees a half-written variant
+                with open(target + ".tmp", "wb") as out:
+                    out.write(compress(data))
+                os.replace(target + ".tmp", target)
+                written += 1
+    return written
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        media_type = guess_type(full_path)[0] or "text/plain"
+        headers = {
+            "Cache-Control": IMMUTABLE if HASHED_NAME.search(os.path.basename(full_path)) else REVALIDATE,
+        }
+
+        if full_path.endswith(COMPRESSIBLE):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS:
+                if encoding not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                # A variant older than its source is stale (file replaced without re-running precompress)
+                if variant_stat.st_mtime >= stat_result.st_mtime:
+                    full_path, stat_result = full_path + suffix, variant_stat
+                    headers["Content-Encoding"] = encoding
+                    break
+
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, media_type=media_type, headers=headers
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def prepare(directory: str):
+    """Precompress at startup; a read-only directory is served as it is."""
+    log = logging.getLogger(__name__)
+    try:
+        written = precompress(directory)
+    except OSError as exc:
+        log.warning("Could not precompress %s: %s", directory, exc)
+        return
+    if written:
+        log.info("Precompressed %d file(s) in %s", written, directory)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "web"
+    print(f"{precompress(directory)} variant(s) written in {directory}")
@@ -0,0 +1,135 @@
+"""The ``voucher_summary`` table: per-voucher bale counts kept next to the bales.
+
+Every write path that touches bales calls ``refresh_voucher_summaries`` for the
+vouchers it changed, inside its own transaction, so a summary row never
+disagrees with committed bales. ``rebuild`` and ``verify`` recompute the whole
+table from ``voucher_bales`` (``python db_tools.py summary``).
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+import analytics
+import models
+import versions
+
+CHUNK_SIZE = 500  # voucher numbers per IN (...), well under SQLite's variable limit
+
+SUMMARY_COLUMNS = (
+    "voucher_number", "voucher_id", "total_bales", "accepted_bales", "rejected_bales",
+    "total_quantity", "excess_bales", "less_bales", "normal_bales", "fully_accepted",
+)
+
+
+def _summary_select(voucher_numbers: Optional[list] = None):
+    """SELECT producing one summary row per voucher number, straight from the bales."""
+    bale = models.VoucherBale
+    count = func.count(bale.id)
+    totals = select(
+        bale.voucher_number,
+        count.label("total_bales"),
+        count.filter(bale.status == "Accepted").label("accepted_bales"),
+        count.filter(bale.status == "Rejected").label("rejected_bales"),
+        func.coalesce(func.sum(bale.quantity), 0).label("total_quantity"),
+        count.filter(bale.remarks.like("Excess%")).label("excess_bales"),
+        count.filter(bale.remarks.like("Less%")).label("less_bales"),
+    ).group_by(bale.voucher_number)
+
+    # Grouped as well: voucher_number is meant to be unique, but old databases may hold duplicates
+    vouchers = select(
+        models.Voucher.voucher_number, func.min(models.Voucher.id).label("voucher_id")
+    ).group_by(models.Voucher.voucher_number)
+
+    if voucher_numbers is not None:
+        totals = totals.where(bale.voucher_number.in_(voucher_numbers))
+        vouchers = vouchers.where(models.Voucher.voucher_number.in_(voucher_numbers))
+    totals = totals.subquery()
+    vouchers = vouchers.subquery()
+
+    total_bales = func.coalesce(totals.c.total_bales, 0)
+    accepted_bales = func.coalesce(totals.c.accepted_bales, 0)
+    excess_bales = func.coalesce(totals.c.excess_bales, 0)
+    less_bales = func.coalesce(totals.c.less_bales, 0)
+    return (
+        select(
+            vouchers.c.voucher_number,
+            vouchers.c.voucher_id,
+            total_bales.label("total_bales"),
+            accepted_bales.label("accepted_bales"),
+            func.coalesce(totals.c.rejected_bales, 0).label("rejected_bales"),
+            func.coalesce(totals.c.total_quantity, 0).label("total_quantity"),
+            excess_bales.label("excess_bales"),
+            less_bales.label("less_bales"),
+            (total_bales - excess_bales - less_bales).label("normal_bales"),
+            and_(total_bales > 0, accepted_bales == total_bales).label("fully_accepted"),
+        )
+        .select_from(vouchers)
+        .outerjoin(totals, totals.c.voucher_number == vouchers.c.voucher_number)
+    )
+
+
+def _write(db: Session, voucher_numbers: Optional[list]):
+    table = models.VoucherSummary.__table__
+    stmt = delete(table)
+    if voucher_numbers is not None:
+        stmt = stmt.where(table.c.voucher_number.in_(voucher_numbers))
+    db.execute(stmt)
+    query = _summary_select(voucher_numbers).add_columns(literal(datetime.utcnow(), DateTime).label("updated_at"))
+    db.execute(insert(table).from_select([*SUMMARY_COLUMNS, "updated_at"], query))
+    versions.touch(db, table.name)
+
+
+def refresh_voucher_summaries(db: Session, voucher_numbers: Iterable[str]):
+    """Recompute the summary rows of ``voucher_numbers`` in the caller's transaction.
+
+    Only the bales of these vouchers are read (through the voucher_number index);
+    nothing is committed here.
+    """
+    voucher_numbers = list(dict.fromkeys(voucher_numbers))
+    analytics.touch(db, voucher_numbers)
+    db.flush()  # pending ORM bale changes must be visible to the aggregate
+    for start in range(0, len(voucher_numbers), CHUNK_SIZE):
+        _write(db, voucher_numbers[start:start + CHUNK_SIZE])
+
+
+def rebuild(db: Session) -> int:
+    """Replace the whole summary table from the bales and commit. Returns the row count."""
+    _write(db, None)
+    db.commit()
+    analytics.rollups.clear()
+    return db.query(models.VoucherSummary).count()
+
+
+def rebuild_if_empty(db: Session):
+    # Databases created before the table existed get it filled once, at startup
+    if db.query(models.VoucherSummary.voucher_number).first() is None \
+            and db.query(models.Voucher.id).first() is not None:
+        rebuild(db)
+
+
+def verify(db: Session) -> list:
+    """Compare the stored summary with one recomputed from the bales.
+
+    Returns ``(voucher_number, column, stored, expected)`` tuples; empty when they agree.
+    """
+    expected = {row.voucher_number: row for row in db.execute(_summary_select())}
+    stored = {row.voucher_number: row for row in db.query(
+        *(getattr(models.VoucherSummary, column) for column in SUMMARY_COLUMNS)
+    )}
+
+    mismatches = []
+    for voucher_number in sorted(expected.keys() | stored.keys()):
+        want, have = expected.get(voucher_number), stored.get(voucher_number)
+        if want is None or have is None:
+            mismatches.append((voucher_number, "row", "present" if have else "missing",
+                               "present" if want else "missing"))
+            continue
+        for column in SUMMARY_COLUMNS[1:]:
+            have_value, want_value = getattr(have, column), getattr(want, column)
+            if column == "fully_accepted":
+                have_value, want_value = bool(have_value), bool(want_value)
+            elif column == "total_quantity":
+                have_value, want_value = round(have_value or 0, 6), round(want_value or 0, 6)
+            if have_value != want_value:
+                mismatches.append((voucher_number, column, have_value, want_value))
+    return mismatches
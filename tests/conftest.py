@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py binds its engine when imported: point it at a scratch file, never ./data.db
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='lrentry-tests-')}/app.db"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+import analytics
+import models
+from cache import master_cache
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    # Both are per process and keyed without the database: one test's rows must not leak into the next
+    analytics.rollups.clear()
+    master_cache.clear()
+    yield
+    analytics.rollups.clear()
+    master_cache.clear()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    with Session(engine) as session:
+        yield session
+
+
+def add_voucher(db, number, bill_date, bales=(), transport_id=1, rate=2.0):
+    """A voucher with ``bales`` given as ``(status, quantity, remarks)``; flushed, not committed."""
+    quantity = sum(quantity for _, quantity, _ in bales)
+    voucher = models.Voucher(
+        voucher_number=number, bill_date=bill_date, invoice_number=f"INV-{number}", party_name="Party A",
+        transport_id=transport_id, lr_number=f"LR-{number}", item_id=1, unit_id=1, rate=rate,
+        quantity=quantity, total_amount=rate * quantity,
+    )
+    db.add(voucher)
+    db.flush()
+    for index, (status, quantity, remarks) in enumerate(bales):
+        db.add(models.VoucherBale(
+            voucher_id=voucher.id, voucher_number=number, invoice_number=voucher.invoice_number,
+            bale_number=f"{number}-B{index}", status=status, quantity=quantity, remarks=remarks,
+        ))
+    db.flush()
+    return voucher
+
+
+@pytest.fixture
+def seeded(db):
+    """Three vouchers over January and February 2025, and payments for two of them plus an orphan bill."""
+    db.add_all([
+        models.TransportCompany(id=1, transport_name="Speed Roadways", rate=1.5),
+        models.TransportCompany(id=2, transport_name="Other Carriers", rate=2.0),
+        models.Item(id=1, item_number="I-1", item_name="Shirting", quantity=1),
+        models.QuantityUnit(id=1, quantity_unit="Bale"),
+    ])
+    add_voucher(db, "V1", date(2025, 1, 15), [
+        ("Accepted", 10.0, "Normal"), ("Accepted", 12.0, "Excess Quantity"), ("Rejected", 5.0, "Less Quantity"),
+    ])
+    add_voucher(db, "V2", date(2025, 2, 3), [("Accepted", 4.0, "Normal"), ("Accepted", 6.0, "Normal")])
+    add_voucher(db, "V3", date(2025, 2, 20), transport_id=2)
+    db.add_all([
+        models.Payment(bill_no="V1", lr_no="LR-V1", amount=54.0, tds_percent=2.0, net_total=54.0,
+                       net_payable=54.0, payment_status="Complete", created_at=datetime(2025, 1, 20, 10, 0)),
+        models.Payment(bill_no="V2", lr_no="LR-V2", amount=20.0, tds_percent=1.0, net_total=20.0,
+                       net_payable=20.0, payment_status="Incomplete", created_at=datetime(2025, 2, 5, 9, 30)),
+        models.Payment(bill_no="V9", lr_no="LR-V9", amount=7.0, tds_percent=0.0, net_total=7.0,
+                       net_payable=7.0, payment_status="Incomplete", created_at=datetime(2025, 2, 6, 8, 0)),
+    ])
+    db.commit()
+    return db
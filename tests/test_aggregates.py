@@ -0,0 +1,115 @@
+"""SQL aggregates that replaced Python loops: payment status, payment totals, voucher_summary, analytics."""
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+import analytics
+import models
+import routes
+import schemas
+import summary
+from conftest import add_voucher
+
+
+def test_payment_status_joins_the_voucher_transport(seeded):
+    rows = routes._payment_status_query(seeded).all()
+    assert [(row.bill_no, row.transport_id) for row in rows] == [("V1", 1), ("V2", 1), ("V9", None)]
+
+
+def test_payment_status_filters_and_pages(seeded):
+    assert [row.bill_no for row in routes._payment_status_query(seeded, status="Incomplete")] == ["V2", "V9"]
+    assert [row.bill_no for row in routes._payment_status_query(seeded, transport_id=1)] == ["V1", "V2"]
+    assert [row.bill_no for row in routes._payment_status_query(
+        seeded, created_from=date(2025, 2, 5), created_to=date(2025, 2, 5)
+    )] == ["V2"]
+
+    first = routes._payment_status_query(seeded, limit=2).all()
+    rest = routes._payment_status_query(seeded, cursor=first[-1].id, limit=2).all()
+    assert [row.bill_no for row in first + rest] == ["V1", "V2", "V9"]
+
+
+def test_payment_status_lists_a_payment_once_for_duplicated_voucher_numbers(seeded):
+    # Databases from before the unique index may hold the same voucher number twice
+    seeded.execute(text("DROP INDEX ix_vouchers_voucher_number"))
+    seeded.execute(text("DROP INDEX ix_vouchers_invoice_number"))
+    add_voucher(seeded, "V1", date(2025, 1, 16), transport_id=2)
+    seeded.commit()
+
+    rows = routes._payment_status_query(seeded, status="Complete").all()
+    assert [(row.bill_no, row.transport_id) for row in rows] == [("V1", 1)]
+
+
+def test_payment_totals_group_by_status(seeded):
+    totals = routes._get_payment_totals(seeded)
+    assert totals["by_status"] == {
+        "Complete": {"count": 1, "amount": 54.0, "net_total": 54.0, "net_payable": 54.0},
+        "Incomplete": {"count": 2, "amount": 27.0, "net_total": 27.0, "net_payable": 27.0},
+    }
+    assert (totals["count"], totals["net_payable"]) == (3, 81.0)
+
+
+def test_summary_rebuild_counts_bales_per_voucher(seeded):
+    assert summary.rebuild(seeded) == 3
+
+    rows = {row.voucher_number: row for row in seeded.query(models.VoucherSummary)}
+    v1 = rows["V1"]
+    assert (v1.total_bales, v1.accepted_bales, v1.rejected_bales, v1.total_quantity) == (3, 2, 1, 27.0)
+    assert (v1.excess_bales, v1.less_bales, v1.normal_bales, v1.fully_accepted) == (1, 1, 1, False)
+    assert (rows["V2"].total_bales, rows["V2"].fully_accepted) == (2, True)
+    # No bales: a row of zeros, never fully accepted
+    assert (rows["V3"].total_bales, rows["V3"].total_quantity, rows["V3"].fully_accepted) == (0, 0, False)
+    assert summary.verify(seeded) == []
+
+
+def test_refresh_voucher_summaries_follows_bale_writes(seeded):
+    summary.rebuild(seeded)
+    seeded.query(models.VoucherBale).filter_by(bale_number="V1-B2").update({"status": "Accepted"})
+    summary.refresh_voucher_summaries(seeded, ["V1"])
+    seeded.commit()
+
+    v1 = seeded.get(models.VoucherSummary, "V1")
+    assert (v1.accepted_bales, v1.rejected_bales, v1.fully_accepted) == (3, 0, True)
+    assert summary.verify(seeded) == []
+
+
+def test_summary_verify_reports_a_stale_row(seeded):
+    summary.rebuild(seeded)
+    seeded.query(models.VoucherSummary).filter_by(voucher_number="V2").update({"accepted_bales": 1})
+    seeded.commit()
+
+    assert summary.verify(seeded) == [("V2", "accepted_bales", 1, 2)]
+
+
+def test_update_bale_quantities_recomputes_voucher_and_payment_totals(seeded):
+    summary.rebuild(seeded)
+    bales, vouchers, payments = routes._update_bale_quantities(seeded, [
+        schemas.BaleQuantityUpdate(voucher_number="V2", bale_number="V2-B0", quantity=8.0, remarks="Excess Quantity"),
+    ])
+    seeded.commit()
+
+    # SUM over the bales, times the voucher rate of 2.0
+    assert vouchers == [{"voucher_number": "V2", "total_quantity": 14.0, "total_amount": 28.0, "net_payable": 28.0}]
+    assert payments == [{"bill_no": "V2", "quantity": 14, "net_total": 28.0, "net_payable": 28.0}]
+    assert seeded.get(models.VoucherSummary, "V2").excess_bales == 1
+
+
+def test_update_bale_quantities_refuses_a_complete_payment(seeded):
+    with pytest.raises(HTTPException) as error:
+        routes._update_bale_quantities(seeded, [
+            schemas.BaleQuantityUpdate(voucher_number="V1", bale_number="V1-B0", quantity=1.0, remarks="Normal"),
+        ])
+    assert error.value.status_code == 400
+
+
+def test_analytics_report_buckets_by_month(seeded):
+    summary.rebuild(seeded)
+    report = analytics.report(seeded, "month", "none", date(2025, 1, 1), date(2025, 2, 28))
+
+    by_period = {row["period"]: row for row in report["rows"]}
+    january, february = by_period[date(2025, 1, 1)], by_period[date(2025, 2, 1)]
+    assert (january["vouchers"], january["bales"], january["accepted_bales"], january["payments"]) == (1, 3, 2, 1)
+    assert (february["vouchers"], february["bales"], february["payments"], february["net_payable"]) == (2, 2, 1, 20.0)
+    # The payment of bill V9 has no voucher and so no bill date: not in any bucket
+    assert report["totals"]["payments"] == 2
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+from sqlalchemy import create_engine, select, text
+
+import db_tools
+import models
+
+
+def _rows(engine, table):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(select(table).order_by(*table.primary_key.columns))]
+
+
+@pytest.mark.parametrize("dialect, serial", [("postgresql", "SERIAL"), ("sqlite", "AUTOINCREMENT")])
+def test_schema_has_every_table_and_index(dialect, serial):
+    out = io.StringIO()
+    db_tools.print_schema(dialect, out)
+    ddl = out.getvalue()
+
+    for table in models.Base.metadata.sorted_tables:
+        assert f"CREATE TABLE {table.name} (" in ddl
+        for index in table.indexes:
+            assert f" INDEX {index.name} ON {table.name} " in ddl
+    assert "CREATE UNIQUE INDEX ux_voucher_bales_voucher_bale" in ddl
+    # change_log.seq must never be reused after pruning
+    assert serial in ddl
+
+
+def test_import_copies_every_table(seeded, engine, tmp_path):
+    target = f"sqlite:///{tmp_path / 'target.db'}"
+    messages = []
+    db_tools.import_database(str(engine.url), target, batch_size=2, log=messages.append)
+
+    target_engine = create_engine(target)
+    for table in models.Base.metadata.sorted_tables:
+        if table.name != models.TableVersion.__tablename__:
+            assert _rows(target_engine, table) == _rows(engine, table), table.name
+    assert "vouchers: 3 row(s)" in messages
+    # Counter rows for the ETags of every table
+    versions = {row[0] for row in _rows(target_engine, models.TableVersion.__table__)}
+    assert versions == set(models.Base.metadata.tables) - {models.TableVersion.__tablename__}
+    target_engine.dispose()
+
+
+def test_import_from_a_database_that_predates_newer_tables(seeded, engine, tmp_path):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE voucher_summary"))
+        conn.execute(text("DROP TABLE change_log"))
+        conn.execute(text("DROP INDEX ix_payments_created_at"))
+        conn.execute(text("ALTER TABLE payments DROP COLUMN quantity"))
+
+    target = f"sqlite:///{tmp_path / 'target.db'}"
+    messages = []
+    db_tools.import_database(str(engine.url), target, log=messages.append)
+
+    target_engine = create_engine(target)
+    assert "change_log: not in the source, left empty" in messages
+    assert "voucher_summary: rebuilt 3 row(s)" in messages
+    with target_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*), count(quantity) FROM payments")).one() == (3, 0)
+        assert conn.execute(text(
+            "SELECT total_bales, accepted_bales FROM voucher_summary WHERE voucher_number = 'V1'"
+        )).one() == (3, 2)
+    target_engine.dispose()
+
+
+def test_import_refuses_a_target_with_data(seeded, engine):
+    with pytest.raises(SystemExit, match="not empty"):
+        db_tools.import_database(str(engine.url), str(engine.url))
@@ -0,0 +1,100 @@
+"""Backend-specific code paths: SQLite pragmas, pool sizing, async URLs and per-dialect SQL."""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import Date, literal, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+
+import analytics
+import database
+import models
+import versions
+
+
+def test_sqlite_pragmas_per_profile(monkeypatch):
+    assert database.sqlite_pragmas("default") == {}
+    assert database.sqlite_pragmas("production")["journal_mode"] == "WAL"
+
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "10000")
+    assert database.sqlite_pragmas("default") == {"busy_timeout": "10000"}
+
+
+def test_sqlite_engine_applies_the_pragmas(tmp_path):
+    engine = database._create_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+    engine.dispose()
+
+
+def test_failed_statements_leave_no_query_timer(tmp_path):
+    engine = database._create_engine(f"sqlite:///{tmp_path / 'timers.db'}")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t (id) VALUES (1)"))
+        with pytest.raises(IntegrityError):
+            conn.execute(text("INSERT INTO t (id) VALUES (1)"))
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing"))
+        assert conn.info["query_start"] == []
+    engine.dispose()
+
+
+def test_pool_settings_split_the_budget_across_workers(monkeypatch):
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "20")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert database.pool_settings() == {"pool_size": 5, "max_overflow": 5, "pool_timeout": 30.0}
+
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    assert database.pool_settings()["pool_size"] == 3
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./data.db", "sqlite+aiosqlite:///./data.db"),
+    ("postgresql://user:pw@host/lrentry", "postgresql+asyncpg://user:pw@host/lrentry"),
+    ("postgresql+psycopg2://user:pw@host/lrentry", "postgresql+asyncpg://user:pw@host/lrentry"),
+])
+def test_async_database_url(url, expected):
+    assert database.async_database_url(url) == expected
+
+
+def test_async_database_url_rejects_other_backends():
+    with pytest.raises(ValueError):
+        database.async_database_url("mysql://user:pw@host/lrentry")
+
+
+def test_explain_on_sqlite(engine):
+    with engine.connect() as conn:
+        plan = database._explain(conn, "SELECT id FROM vouchers WHERE voucher_number = ?", ("V1",))
+    assert "ix_vouchers_voucher_number" in plan
+
+
+@pytest.mark.parametrize("granularity", analytics.GRANULARITIES)
+def test_sqlite_buckets_agree_with_bucket_start(db, granularity):
+    days = [date(2024, 12, 25) + timedelta(days=n) for n in range(70)]
+    for day in days:
+        bucket = db.execute(select(analytics._bucket_expression(literal(day, Date), granularity, "sqlite"))).scalar()
+        assert bucket == analytics.bucket_start(day, granularity), day
+
+
+def test_postgresql_buckets_use_date_trunc():
+    expression = analytics._bucket_expression(models.Voucher.bill_date, "week", "postgresql")
+    sql = str(expression.compile(dialect=postgresql.dialect()))
+    assert sql == "CAST(date_trunc(%(date_trunc_1)s, vouchers.bill_date) AS DATE)"
+
+
+@pytest.mark.parametrize("dialect", [sqlite.dialect(), postgresql.dialect()])
+def test_version_rows_insert_on_conflict_do_nothing(dialect):
+    insert = versions.INSERTS[dialect.name](versions.TABLE).on_conflict_do_nothing(index_elements=[versions.TABLE.c.name])
+    assert "ON CONFLICT (name) DO NOTHING" in str(insert.compile(dialect=dialect))
+
+
+def test_versions_ensure_skips_rows_another_worker_created(db, monkeypatch):
+    versions.ensure(db)
+    created = db.query(models.TableVersion).count()
+
+    # A second worker that read the table before the first one committed: every row looks missing
+    monkeypatch.setattr(versions, "select", lambda *columns: select(*columns).where(literal(False)))
+    versions.ensure(db)
+    assert db.query(models.TableVersion).count() == created
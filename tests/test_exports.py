@@ -0,0 +1,27 @@
+import pytest
+
+import exports
+import routes
+
+
+def _csv(query, to_dict):
+    return "".join(exports.export_lines((to_dict(row) for row in query), "csv", exports.query_columns(query)))
+
+
+def test_csv_header_comes_from_the_first_row(seeded):
+    lines = _csv(routes._recent_payments_query(seeded), routes._recent_payment_to_dict).splitlines()
+    assert lines[0] == ",".join(routes.RECENT_PAYMENT_COLUMNS)
+    assert len(lines) == 4
+
+
+@pytest.mark.parametrize("query, to_dict, header", [
+    (routes._recent_payments_query, routes._recent_payment_to_dict, ",".join(routes.RECENT_PAYMENT_COLUMNS)),
+    (routes._all_bales_query, routes._bale_full_to_dict, "bale_number,quantity,status,remarks,voucher_number,invoice_number"),
+    (lambda db: routes._voucher_details_query(db), None, "id,voucher_number,bill_date,"),
+])
+def test_csv_of_no_rows_still_has_a_header(db, query, to_dict, header):
+    assert _csv(query(db), to_dict).startswith(header)
+
+
+def test_ndjson_of_no_rows_is_empty(db):
+    assert "".join(exports.export_lines(iter(()), "ndjson", ["id"])) == ""
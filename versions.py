@@ -0,0 +1,90 @@
+"""Per-table version counters behind the ETags of the JSON list endpoints.
+
+Every session transaction that writes to a table increments that table's row
+in ``table_versions`` inside the same transaction, so the counter changes
+exactly when committed data does, in whichever worker process wrote it. A list
+endpoint reads the counters of the tables it is built from (one small query)
+before its data and hashes them with the request URL into a weak ETag; a
+client sending that ETag back in If-None-Match gets a 304 without the rows
+being loaded or encoded.
+
+ORM flushes are tracked by a session hook; statement writes (``db.execute`` of
+insert / update / delete) call ``touch`` next to the statement. A
+``do_orm_execute`` hook would see those too, but any such listener breaks
+``yield_per`` with ``selectinload`` (the streaming exports). Writes that bypass
+sessions (raw connections, external tools) do not bump anything; clients then
+keep their copy until the next write that does.
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import models
+
+TABLE = models.TableVersion.__table__
+
+# INSERT ... ON CONFLICT DO NOTHING, per backend
+INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def ensure(db: Session):
+    """Create the counter rows of tables that have none yet and commit.
+
+    Workers starting together all find the same rows missing; rows another
+    worker inserted first are skipped instead of failing on the primary key.
+    """
+    existing = set(db.execute(select(TABLE.c.name)).scalars())
+    missing = [name for name in models.Base.metadata.tables if name not in existing and name != TABLE.name]
+    if missing:
+        insert = INSERTS[db.get_bind().dialect.name](TABLE).on_conflict_do_nothing(index_elements=[TABLE.c.name])
+        db.execute(insert, [{"name": name, "version": 1, "updated_at": datetime.utcnow()} for name in missing])
+    db.commit()
+
+
+def current(db: Session, tables: Iterable[str]) -> dict:
+    return dict(db.execute(select(TABLE.c.name, TABLE.c.version).where(TABLE.c.name.in_(list(tables)))).all())
+
+
+def etag(db: Session, tables: Iterable[str], key: str) -> str:
+    """Weak ETag for a response built from ``tables``; ``key`` tells requests apart (path and query)."""
+    counters = current(db, tables)
+    digest = hashlib.sha1(f"{key}|{sorted(counters.items())}".encode()).hexdigest()
+    # Weak: the same representation is sent gzipped or not (GZipMiddleware)
+    return f'W/"{digest}"'
+
+
+def touch(db: Session, *tables: str):
+    """Mark ``tables`` as written in this transaction.
+
+    Needed after every ``db.execute`` of an INSERT / UPDATE / DELETE, ORM
+    entity or Core table alike; changes flushed from ORM instances are picked
+    up by ``_track_flush``.
+    """
+    db.info.setdefault("written_tables", set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    touch(session, *{
+        table.name
+        for instance in (*session.new, *session.dirty, *session.deleted)
+        for table in type(instance).__mapper__.tables
+    })
+
+
+@event.listens_for(Session, "before_commit")
+def _bump(session):
+    session.flush()  # pending ORM changes reach after_flush first
+    names = session.info.pop("written_tables", None)
+    if names:
+        session.execute(
+            update(TABLE).where(TABLE.c.name.in_(sorted(names)))
+            .values(version=TABLE.c.version + 1, updated_at=datetime.utcnow())
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("written_tables", None)